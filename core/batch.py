@@ -0,0 +1,200 @@
+# standard modules
+from itertools import product
+import argparse
+import glob
+import json
+import os
+import time
+import traceback
+
+# application specific modules
+import numpy as np
+
+# custom modules
+import eval as ev
+
+def grid(index=(15, 30, 50, 75, 100), estimators=('sample', 'shrunk'), windows=(60,), runs=10, seeds=(0,)):
+    """Expands an experiment grid into its jobs, in a fixed order so every machine sees the same list
+
+    Parameters
+    ----------
+    index : benchmark index sizes
+    estimators : covariance estimators, 'sample' and/or 'shrunk'
+    windows : rolling window lengths in months
+    runs : number of runs per configuration and seed
+    seeds : base seeds; run r of base seed s is seeded with s * 10000 + r
+
+    Returns
+    -------
+    list : dictionaries with the id, index, estimator, window, seed and run of each job
+
+    """
+    jobs = []
+    for n, estimator, window, seed, run in product(sorted(index), sorted(estimators), sorted(windows),
+            sorted(seeds), range(runs)):
+        jobs.append({
+            'id': 'n=%d/estimator=%s/window=%d/seed=%d/run=%d' % (n, estimator, window, seed, run),
+            'index': n,
+            'estimator': estimator,
+            'window': window,
+            'seed': seed * 10000 + run,
+            'run': run
+        })
+
+    return jobs
+
+def shard(jobs, k, K):
+    """Returns shard k (0 based) of K, every K-th job starting at k so that shards are balanced across
+        index sizes"""
+    if not 0 <= k < K:
+        raise ValueError('Shard must be between 0 and %d' % (K - 1))
+    return jobs[k::K]
+
+def execute(jobs, out, k=0, K=1):
+    """Runs jobs and appends one json line per job to out/results-k-of-K.jsonl. Jobs already completed in the
+        file are skipped and failed ones are run again, so an interrupted shard can simply be started again
+
+    Parameters
+    ----------
+    jobs : list of jobs as returned by grid and shard
+    out : output directory
+    k : shard number, used to name the output file
+    K : number of shards, used to name the output file
+
+    Returns
+    -------
+    string : path of the output file
+
+    """
+    if not os.path.isdir(out):
+        os.makedirs(out)
+
+    path = os.path.join(out, 'results-%d-of-%d.jsonl' % (k, K))
+
+    done = set()
+    if os.path.exists(path):
+        for line in open(path):
+            if line.strip():
+                record = json.loads(line)
+                if 'result' in record:
+                    done.add(record['id'])
+
+    for cnt, job in enumerate(jobs):
+        if job['id'] in done:
+            continue
+
+        np.random.seed(job['seed'])
+        s = time.time()
+        record = dict(job)
+
+        try:
+            res = ev.eval(job['estimator'], index=job['index'], roll=job['window'])
+            record['result'] = dict((key, float(value)) for key, value in res.items())
+        except Exception:
+            record['error'] = traceback.format_exc()
+
+        record['seconds'] = time.time() - s
+
+        # one line per job, flushed as it completes
+        fh = open(path, 'a')
+        fh.write(json.dumps(record, sort_keys=True) + '\n')
+        fh.close()
+
+        print 'job', cnt+1, 'of', len(jobs), job['id'], 'failed' if 'error' in record else 'done', \
+            'in', round(record['seconds'], 2), 'seconds'
+
+    return path
+
+def merge(out):
+    """Merges the results of all shards in out, averaging every statistic over the runs and seeds of each
+        index size, estimator and window
+
+    Parameters
+    ----------
+    out : directory holding the results-*.jsonl files
+
+    Returns
+    -------
+    list : dictionaries with the index, estimator, window, number of runs and the mean and standard
+        deviation of each statistic
+
+    """
+    records = {}
+    for path in sorted(glob.glob(os.path.join(out, 'results-*.jsonl'))):
+        for line in open(path):
+            if line.strip():
+                record = json.loads(line)
+                if 'result' in record:
+                    records[record['id']] = record
+
+    groups = {}
+    for record in records.values():
+        key = (record['index'], record['estimator'], record['window'])
+        groups.setdefault(key, []).append(record['result'])
+
+    summary = []
+    for key in sorted(groups.keys()):
+        results = groups[key]
+        row = {'index': key[0], 'estimator': key[1], 'window': key[2], 'runs': len(results)}
+        for stat in sorted(results[0].keys()):
+            values = np.array([r[stat] for r in results])
+            row[stat] = values.mean()
+            row[stat + '_std'] = values.std()
+        summary.append(row)
+
+    return summary
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Runs a sharded grid of covshrink experiments without plotting')
+    commands = parser.add_subparsers(dest='command')
+
+    run = commands.add_parser('run', help='run shard k of K of the grid')
+    run.add_argument('--grid', help='json file with index, estimators, windows, runs and seeds; overrides the flags')
+    run.add_argument('--index', default='15,30,50,75,100', help='comma separated index sizes')
+    run.add_argument('--estimators', default='sample,shrunk', help='comma separated estimators')
+    run.add_argument('--windows', default='60', help='comma separated window lengths in months')
+    run.add_argument('--runs', type=int, default=10)
+    run.add_argument('--seeds', default='0', help='comma separated base seeds')
+    run.add_argument('--shard', default='0/1', help='k/K, run the k-th (0 based) of K shards')
+    run.add_argument('--out', default='results')
+    run.add_argument('--list', action='store_true', help='print the jobs of the shard instead of running them')
+
+    summary = commands.add_parser('merge', help='merge the results of all shards')
+    summary.add_argument('--out', default='results')
+    summary.add_argument('--summary', help='also write the merged table to this json file')
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'merge':
+        rows = merge(args.out)
+
+        print 'N\tEstimator\tWindow\tRuns\tIR\tMean\tSD\tTE'
+        for r in rows:
+            print '%d\t%s\t\t%d\t%d\t%.4f\t%.4f\t%.4f\t%.4f' % (r['index'], r['estimator'], r['window'], r['runs'],
+                r['information_ratio'], r['mean_excess_return'], r['stdev_excess_return'], r['tracking_error'])
+
+        if args.summary:
+            fh = open(args.summary, 'w')
+            fh.write(json.dumps(rows, indent=2, sort_keys=True))
+            fh.close()
+        return
+
+    if args.grid:
+        spec = json.load(open(args.grid))
+    else:
+        ints = lambda s: [int(v) for v in s.split(',')]
+        spec = {'index': ints(args.index), 'estimators': args.estimators.split(','), 'windows': ints(args.windows),
+            'runs': args.runs, 'seeds': ints(args.seeds)}
+
+    k, K = [int(v) for v in args.shard.split('/')]
+    jobs = shard(grid(**spec), k, K)
+
+    if args.list:
+        for job in jobs:
+            print job['id']
+        return
+
+    print 'wrote', execute(jobs, args.out, k, K)
+
+if __name__ == '__main__':
+    main()
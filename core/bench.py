@@ -0,0 +1,441 @@
+# standard modules
+from datetime import datetime
+from dateutil import relativedelta
+from StringIO import StringIO
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+# application specific modules
+import numpy as np
+
+# custom modules
+import createdailytable
+import eval as ev
+import inspricehist as ph
+import optimize as op
+import params
+import portfolio
+import shrinkage as sh
+import store
+
+class SyntheticPriceHist(ph.InsertPriceHist):
+
+    def __init__(self, periods=None, seed=0):
+        """Price history loader serving synthetic geometric brownian motion prices in the Yahoo csv format
+            instead of downloading them, so the ingest path can be timed without the network
+
+        Parameters
+        ----------
+        periods : number of periods to generate; defaults to every period between start and end on insert
+        seed : seed for the random prices, each ticker's series is a function of the seed and ticker only
+
+        """
+        ph.InsertPriceHist.__init__(self)
+        self._periods = periods
+        self._seed = seed
+        self._csv = {}
+
+    def _dates(self, start, end, freq):
+        """Period start dates from start to end, newest first as served by Yahoo"""
+        if freq == 'd':
+            step = relativedelta.relativedelta(days=1)
+        elif freq == 'w':
+            step = relativedelta.relativedelta(weeks=1)
+        elif freq == 'm':
+            step = relativedelta.relativedelta(months=1)
+        else:
+            step = relativedelta.relativedelta(years=1)
+
+        dates = []
+        d = start
+        while d <= end and (self._periods is None or len(dates) < self._periods):
+            dates.append(d)
+            d = d + step
+
+        return dates[::-1]
+
+    def get_csv(self, ticker, date1, date2, freq):
+        """Builds (once) the csv served for ticker"""
+        key = (ticker, date1, date2, freq)
+
+        if key not in self._csv:
+            dates = self._dates(date1, date2, freq)
+            rng = np.random.RandomState(abs(hash((self._seed, ticker))) % (2**32))
+
+            close = 20.0 * np.exp(np.cumsum(0.005 + 0.08 * rng.randn(len(dates))))[::-1]
+            spread = 1.0 + 0.02 * rng.rand(len(dates))
+            volume = rng.randint(10**5, 10**7, len(dates))
+
+            lines = ['Date,Open,High,Low,Close,Volume,Adj Close']
+            for d, c, s, v in zip(dates, close, spread, volume):
+                lines.append('%s,%.2f,%.2f,%.2f,%.2f,%d,%.2f' % (d.strftime('%Y-%m-%d'), c, c * s, c / s, c, v, c))
+
+            self._csv[key] = '\n'.join(lines) + '\n'
+
+        return self._csv[key]
+
+    def _fetch_historical_yahoo(self, ticker, date1, date2, freq=None, cachename=None):
+        return StringIO(self.get_csv(ticker, date1, date2, freq))
+
+def synthetic_params(assets, periods, freq='m', start=None):
+    """Builds portfolio parameters in the format of params.get_portfolio_params for synthetic tickers
+
+    Parameters
+    ----------
+    assets : number of tickers
+    periods : number of periods held
+    freq : frequency of the data {d, w, m, y}
+    start : first date held; defaults to 1990-02-01
+
+    Returns
+    -------
+    dictionary : portfolio parameters
+
+    """
+    if start is None:
+        start = datetime(1990, 2, 1)
+
+    steps = {'d': relativedelta.relativedelta(days=periods-1), 'w': relativedelta.relativedelta(weeks=periods-1),
+        'm': relativedelta.relativedelta(months=periods-1), 'y': relativedelta.relativedelta(years=periods-1)}
+    end = start + steps[freq]
+
+    tickers = ['S%04d' % i for i in xrange(assets)]
+
+    return {
+        'expected_returns': dict((t, 0.03) for t in tickers),
+        'holding_periods': dict((t, {'start': start, 'end': end}) for t in tickers),
+        'shares': dict((t, 1 + i % 100) for i, t in enumerate(tickers)),
+        'constraints': {'min_position': 0.05, 'max_position': 0.15, 'target_gain': 0.03},
+        'defaults': {'frequency': freq, 'start': start, 'end': end}
+    }
+
+def _timed(fn, repeat=1):
+    """Calls fn repeat times
+
+    Returns
+    -------
+    tuple : dictionary with the best, mean and worst time in seconds, value returned by the last call
+
+    """
+    times = []
+    for i in xrange(repeat):
+        s = time.time()
+        res = fn()
+        times.append(time.time() - s)
+
+    return {'best': min(times), 'mean': sum(times) / len(times), 'worst': max(times)}, res
+
+def _revision():
+    """Returns the git revision of the working tree, if there is one"""
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=os.path.dirname(os.path.abspath(__file__)), stderr=open(os.devnull, 'w')).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run(assets=100, periods=240, freq='m', index=30, repeat=3, history='bench_history.jsonl', seed=0):
+    """Runs the benchmark suite against a synthetic price table in a scratch directory and appends the results
+        to the history file
+
+    Parameters
+    ----------
+    assets : number of synthetic tickers for the ingest, load, covariance, shrinkage and QP stages
+    periods : number of periods per ticker
+    freq : frequency of the synthetic data {d, w, m, y}
+    index : benchmark index size for the full eval.eval backtest; None skips it
+    repeat : number of timed repetitions of each stage (the ingest and the backtest run once)
+    history : path of the json lines file the results are appended to; None to not record them
+    seed : seed for the synthetic prices
+
+    Returns
+    -------
+    dictionary : the benchmark record
+
+    """
+    from cvxopt import matrix
+
+    if history is not None:
+        history = os.path.abspath(history)
+
+    record = {
+        'timestamp': time.time(),
+        'revision': _revision(),
+        'config': {'assets': assets, 'periods': periods, 'freq': freq, 'index': index, 'repeat': repeat, 'seed': seed},
+        'stages': {}
+    }
+    stages = record['stages']
+
+    cwd = os.getcwd()
+    path = store.get_path()
+    scratch = tempfile.mkdtemp(prefix='covshrink-bench-')
+    os.chdir(scratch)
+
+    # COVSHRINK_STORE may point at the user's store by an absolute path, so the run gets its own
+    store.set_path(os.path.join(scratch, 'price_data.h5'))
+
+    try:
+        np.random.seed(seed)
+        port_params = synthetic_params(assets, periods, freq)
+        loader = SyntheticPriceHist(seed=seed)
+        tickers = sorted(port_params['holding_periods'].keys())
+        periods_ = port_params['holding_periods']
+
+        # generate the csv up front so only parsing and inserting is timed; insert always fetches daily bars
+        for t in tickers:
+            loader.get_csv(t, periods_[t]['start'], periods_[t]['end'], 'd')
+
+        # ingest
+        createdailytable.reset_table()
+        def ingest():
+            for t in tickers:
+                loader.insert(t, periods_[t]['start'], periods_[t]['end'], freq)
+        stats, res = _timed(ingest)
+
+        # daily rows are fetched and the lower frequencies derived from them
+        with store.reader() as h5f:
+            stats['rows'] = h5f.getNode('/price_data').nrows
+        stats['rows_per_second'] = stats['rows'] / stats['best']
+        stages['insert'] = stats
+
+        port = portfolio.Portfolio(port_params, lazy=True, loader=loader)
+
+        # load
+        def load():
+            for t in tickers:
+                port._read_historic_data(t, periods_[t]['start'], periods_[t]['end'])
+        stats, res = _timed(load, repeat)
+        stats['per_ticker'] = stats['best'] / assets
+        stages['load'] = stats
+
+        # the leading period has no returns
+        returns = port.get_active_returns().dropna()
+
+        # covariance
+        stats, cov = _timed(lambda: port.get_covariance_matrix(returns), repeat)
+        stages['covariance'] = stats
+
+        # shrinkage, on the returns as in eval.eval
+        stats, res = _timed(lambda: port.get_shrunk_covariance_matrix(returns), repeat)
+        stages['shrinkage'] = stats
+        sigma = res[0]
+
+        # qp
+        a = matrix(np.require(np.random.randn(len(tickers), 1) * 0.01, dtype=np.float64, requirements=['F']))
+        S = matrix(np.require(sigma.values, dtype=np.float64, requirements=['F']))
+        stats, res = _timed(lambda: op.optimize(a, S), repeat)
+        stages['optimize'] = stats
+
+        # full backtest on the params universe, served from the store filled here
+        if index is not None:
+            real = params.get_portfolio_params(index=index)
+            real_loader = SyntheticPriceHist(seed=seed)
+            for t, p in real['holding_periods'].items():
+                real_loader.insert(t, p['start'], p['end'], real['defaults']['frequency'])
+
+            stats, res = _timed(lambda: ev.eval('shrunk', index=index))
+            stages['eval'] = stats
+
+    finally:
+        store.set_path(path)
+        os.chdir(cwd)
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    if history is not None:
+        _record(record, history)
+
+    return record
+
+def _panel(assets, periods, seed=0):
+    """Draws a T x N panel of daily returns from a three factor model with fat tailed (t with 5 degrees of
+        freedom) factors and residuals"""
+    rs = np.random.RandomState(seed)
+    factors = rs.standard_t(5, (periods, 3)) * 0.01
+    return np.dot(factors, rs.randn(3, assets)) + rs.standard_t(5, (periods, assets)) * 0.02
+
+def _precision_worker(assets, periods, dtype, repeat, seed):
+    """Times the covariance and shrinkage estimators in one dtype and prints the timings and the growth of
+        the peak resident memory over the panel as json; run in a fresh interpreter by precision"""
+    import resource
+
+    x = _panel(assets, periods, seed)
+    stages = {}
+
+    for name, fn in [('covariance', lambda: sh.covariance(x, dtype)), ('shrinkage', lambda: sh.cov_cor(x, dtype))]:
+        before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        stats, res = _timed(fn, repeat)
+        # ru_maxrss is in kilobytes on linux
+        stats['peak_mb'] = (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - before) / 1024.0
+        stages['%s_%s' % (name, np.dtype(dtype).name)] = stats
+        res = None
+
+    print json.dumps(stages)
+
+def precision(assets=2000, periods=2520, repeat=3, history='bench_history.jsonl', seed=0):
+    """Benchmarks the float32 mode of the covariance and shrinkage estimators against float64 on a synthetic
+        panel of daily returns: time and peak memory of each estimator in each dtype, each measured in a fresh
+        interpreter, and the error of the float32 results
+
+    Parameters
+    ----------
+    assets : number of assets in the panel
+    periods : number of daily periods in the panel
+    repeat : number of timed repetitions of each estimator
+    history : path of the json lines file the results are appended to; None to not record them
+    seed : seed for the synthetic returns
+
+    Returns
+    -------
+    dictionary : the benchmark record, with the errors under precision
+
+    """
+    record = {
+        'timestamp': time.time(),
+        'revision': _revision(),
+        'config': {'assets': assets, 'periods': periods, 'repeat': repeat, 'seed': seed},
+        'stages': {}
+    }
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    for dtype in ['float64', 'float32']:
+        code = 'import numpy as np\nimport bench\nbench._precision_worker(%d, %d, np.%s, %d, %d)' % (
+            assets, periods, dtype, repeat, seed)
+        record['stages'].update(json.loads(subprocess.check_output([sys.executable, '-c', code], cwd=here)))
+
+    x = _panel(assets, periods, seed)
+    sigma64, shrinkage64 = sh.cov_cor(x)
+    sigma32, shrinkage32 = sh.cov_cor(x, np.float32)
+
+    record['precision'] = {
+        'shrinkage': shrinkage64,
+        'shrinkage_error': abs(shrinkage32 - shrinkage64),
+        'sigma_error': float(np.abs(sigma32 - sigma64).max() / np.abs(sigma64).max())
+    }
+
+    if history is not None:
+        _record(record, os.path.abspath(history))
+
+    return record
+
+def _record(record, history):
+    """Appends record to the history file"""
+    fh = open(history, 'a')
+    fh.write(json.dumps(record, sort_keys=True) + '\n')
+    fh.close()
+
+def _cold(statement, repeat):
+    """Times statement in fresh interpreters started in the module directory
+
+    Returns
+    -------
+    dictionary : the best, mean and worst time in seconds
+
+    """
+    here = os.path.dirname(os.path.abspath(__file__))
+    code = 'import time\ns = time.time()\n%s\nprint time.time() - s' % statement
+
+    times = [float(subprocess.check_output([sys.executable, '-c', code], cwd=here).strip()) for i in xrange(repeat)]
+    return {'best': min(times), 'mean': sum(times) / len(times), 'worst': max(times)}
+
+def import_times(modules=('portfolio', 'eval', 'optimize'), repeat=5, history='bench_history.jsonl'):
+    """Times the cold start of the package: `import module` in a fresh interpreter for each module, and
+        starting a worker process that imports portfolio, as a pool of backtests does
+
+    Parameters
+    ----------
+    modules : modules whose import is timed
+    repeat : number of fresh interpreters per measurement
+    history : path of the json lines file the results are appended to; None to not record them
+
+    Returns
+    -------
+    dictionary : the benchmark record
+
+    """
+    record = {
+        'timestamp': time.time(),
+        'revision': _revision(),
+        'config': {'assets': 0, 'periods': 0, 'repeat': repeat, 'imports': list(modules)},
+        'stages': {}
+    }
+
+    for module in modules:
+        record['stages']['import_' + module] = _cold('import %s' % module, repeat)
+
+    # the pool forks a fresh child which has to import portfolio itself; the task returns None because the
+    # module object cannot be pickled back, and it is defined in the timed script rather than in bench so
+    # that the parent does not import portfolio before forking
+    record['stages']['spawn_worker'] = _cold('import multiprocessing\n'
+        'def load():\n    __import__(\'portfolio\')\n'
+        'pool = multiprocessing.Pool(1)\npool.apply(load)\npool.close()\npool.join()', repeat)
+
+    if history is not None:
+        _record(record, os.path.abspath(history))
+
+    return record
+
+def compare(history='bench_history.jsonl', stage=None):
+    """Prints the best time of each stage across the recorded runs, oldest first
+
+    Parameters
+    ----------
+    history : path of the json lines file written by run
+    stage : optional stage name to restrict the report to
+
+    """
+    records = [json.loads(line) for line in open(history) if line.strip()]
+    names = sorted(set(n for r in records for n in r['stages'] if stage is None or n == stage))
+
+    print 'revision\tassets\tperiods\t' + '\t'.join(names)
+    for r in records:
+        cols = ['%.4f' % r['stages'][n]['best'] if n in r['stages'] else '-' for n in names]
+        print '%s\t%d\t%d\t%s' % (r['revision'], r['config']['assets'], r['config']['periods'], '\t'.join(cols))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Times the covshrink pipeline stages on synthetic data')
+    parser.add_argument('--assets', type=int, help='defaults to 100, or 2000 with --precision')
+    parser.add_argument('--periods', type=int, help='defaults to 240, or 2520 with --precision')
+    parser.add_argument('--freq', default='m', choices=['d', 'w', 'm', 'y'])
+    parser.add_argument('--index', type=int, default=30, help='index size of the full backtest, 0 to skip it')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--history', default='bench_history.jsonl')
+    parser.add_argument('--compare', action='store_true', help='report the recorded history instead of running')
+    parser.add_argument('--imports', action='store_true', help='time cold imports and worker start-up instead')
+    parser.add_argument('--precision', action='store_true', help='compare the float32 and float64 estimators instead')
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        compare(args.history)
+        return
+
+    if args.imports:
+        record = import_times(repeat=args.repeat, history=args.history)
+        for name, s in sorted(record['stages'].items()):
+            print '%s\t%.4f\t%.4f\t%.4f' % (name.ljust(20), s['best'], s['mean'], s['worst'])
+        return
+
+    if args.precision:
+        record = precision(args.assets or 2000, args.periods or 2520, args.repeat, args.history, args.seed)
+        print 'stage\t\t\tbest\tmean\tworst\tpeak MB'
+        for name, s in sorted(record['stages'].items()):
+            print '%s\t%.4f\t%.4f\t%.4f\t%.1f' % (name.ljust(20), s['best'], s['mean'], s['worst'], s['peak_mb'])
+        print 'shrinkage %.6f, float32 error %.2e, largest error in sigma %.2e of its largest entry' % (
+            record['precision']['shrinkage'], record['precision']['shrinkage_error'], record['precision']['sigma_error'])
+        return
+
+    record = run(args.assets or 100, args.periods or 240, args.freq, args.index or None, args.repeat, args.history, args.seed)
+
+    print 'stage\t\tbest\tmean\tworst'
+    for name in ['insert', 'load', 'covariance', 'shrinkage', 'optimize', 'eval']:
+        if name in record['stages']:
+            s = record['stages'][name]
+            print '%s\t%.4f\t%.4f\t%.4f' % (name.ljust(12), s['best'], s['mean'], s['worst'])
+
+if __name__ == '__main__':
+    main()
@@ -1,17 +1,16 @@
-#related third party imports
-import tables
+# custom modules
+import store
 
-def reset_table():
-    """Creates h5f flatfile for storing price data
-    
-    Returns
-    -------
-    h5f handle : returns a writable file handle for pytables table
-    
-    """
-    h5f = tables.openFile('price_data.h5', 'w')
+# columns of the price table with a completely sorted index; date range reads (see streaming.read_returns)
+# then touch only the rows of the range instead of scanning the table
+INDEXES = ('date',)
+
+def _description():
+    """Returns the pytables description of the price table"""
+    #related third party imports, imported on use so that importing the module stays cheap
+    import tables
 
-    description = {
+    return {
         "ticker": tables.StringCol(itemsize=6, dflt='', pos=1),
         "frequency": tables.StringCol(itemsize=1, dflt='d', pos=2),
         "date": tables.Time32Col(dflt=0.00, pos=3),
@@ -24,6 +23,27 @@ def reset_table():
         "timestamp": tables.Time64Col(dflt=0.00, pos=10)
     }
 
-    table = h5f.createTable('/', 'price_data', description)
+def reset_table():
+    """Creates h5f flatfile for storing price data, discarding any data already stored
+    
+    Returns
+    -------
+    h5f handle : returns a writable file handle for pytables table
+    
+    """
+    # under the store's writer lock, so readers in other processes reopen the new file
+    with store.writer('w') as h5f:
+        table = h5f.createTable('/', 'price_data', _description())
+        for column in INDEXES:
+            getattr(table.cols, column).createCSIndex()
 
-    h5f.close()
\ No newline at end of file
+def create_table():
+    """Creates the h5f flatfile for storing price data unless the store already holds the price table, so
+        processes sharing the store never wipe each other's data
+    
+    Returns
+    -------
+    boolean : true if the table was created
+    
+    """
+    return store.create('/', 'price_data', _description(), indexes=INDEXES)
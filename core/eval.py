@@ -6,40 +6,55 @@ import math
 import time
 
 # application specific modules
-import pylab
+# pylab and cvxopt are imported where they are used so that importing the module stays cheap
 
 # custom modules
 import params
 import portfolio
+import risk
 import optimize as op
+import shrinkage as sh
+import simulate
+import stats
+import streaming
+import instrument
+import universe
 import numpy as np
 import pandas
-from cvxopt import matrix
 
-def eval(type, index=30):
-    """Executes the experiment
+def _rolling_weights(port, type, roll=60, constraints=None, turnover=None, outsample=None, path=None, shrink=None,
+        stack=None, pairwise=False, target=None):
+    """Optimizes the portfolio over rolling windows of active returns
     
     Parameters
     ----------
+    port : portfolio.Portfolio to optimize
     type : a string representing the type of covariance matrix to optimize against, either 'sample' or 'shrunk'
-    index : benchmark index size to use
+    roll : length of the rolling estimation window in months
+    constraints : optional portfolio constraints passed to optimize.optimize
+    turnover : optional limit on the turnover between consecutive optimized portfolios
+    outsample : optional number of out-of-sample periods, the last ones of the data; by default every
+        period after the first window
+    path : optional shrinkage.ShrinkagePath recording the estimator's intermediate quantities per window,
+        keyed by the universe, roll, pairwise and target as well as the index of the last date of the window
+        (see _path_key), so a path shared by runs with other settings is never read for the wrong window
+    shrink : optional fixed shrinkage intensity; windows cached in path are shrunk again without
+        recomputing their sample and prior matrices
+    stack : optional risk.CovarianceStack collecting the covariance matrix optimized against in each window
+    pairwise : estimate the sample covariance matrix pairwise complete, see shrinkage.pairwise_covariance,
+        instead of dropping every period in which a live ticker is missing; the validity mask of the active
+        returns is computed once and sliced per window, and tickers need an alpha at the end of the window
+        and two observed periods in it to be live; the shrunk estimator still needs complete periods
+    target : optional shrinkage.TargetCache of the universe for 'shrunk' to shrink towards instead of the
+        constant correlation matrix; the target of each subset of live tickers is cut once and reused
     
     Returns
     -------
-    dictionary : returns a dictionary with sample statistics for the information ratio, mean excess return,
-        standard deviation of excess returns, and tracking error
+    generator : yields the index of the last date in each window and the N numpy.ndarray of optimized weights
     """
-    # get the portfolio parameters
-    port_params = params.get_portfolio_params(index=index)
+    from cvxopt import matrix
 
-    # instantiate the porfolio object
-    port = portfolio.Portfolio(port_params, proxy={})
-
-    # setup the periodicity
-    roll = 60
     rollperiod = relativedelta.relativedelta(months=roll)
-    outsample = 60
-    outsampleperiod = relativedelta.relativedelta(months=outsample)
 
     # setup 
     dates = port.get_trading_dates()
@@ -49,78 +64,480 @@ def eval(type, index=30):
     delta = relativedelta.relativedelta(end, start)
     periods = (delta.years * 12) + delta.months
 
-    portvalue = port.get_portfolio_historic_position_values()
-    
-    # constant benchmark weights
-    #returns = port.get_portfolio_historic_returns()
-    active = port.get_active_returns()
-    bench_returns = port.get_benchmark_returns()
-    bench_weights = port.get_benchmark_weights()
+    with instrument.span('load'):
+        active = port.get_active_returns()
+        expected_excess_returns = port.get_expected_excess_stock_returns()
+
+    # the estimates of each window only cover the tickers in the index for the whole window; the work space
+    # is allocated once for the full universe and reused by every window
+    tickers = active.columns
+    membership = port.get_membership()
+    buffers = universe.WindowBuffers(len(active.index), len(tickers))
+
+    if pairwise:
+        values = active.values
+        observed = sh.validity(values)
 
-    expected_excess_returns = port.get_expected_excess_stock_returns()
+    # the alphas of each window are looked up by exact date; a date without a row has no alphas
+    alphas = expected_excess_returns.values
+    rows = expected_excess_returns.index.get_indexer(dates)
 
-    e = []; te = [];
+    x = None
 
-    for i in xrange(roll, periods+roll+1):
+    first = roll
+    if outsample is not None:
+        first = max(roll, periods + roll + 1 - outsample)
+
+    for i in xrange(first, periods+roll+1):
         
         # setup the dates to calculate returns for the covariance matrixes
         start = dates[i-roll]
         end = dates[i]
 
-        active_returns = active.ix[start:end]
-        
-        # compute the sample covariance matrix, cov of active returns
-        cov = port.get_covariance_matrix(active_returns)
-        
-        # actual realized returns
-        y = ((portvalue.ix[end:end].as_matrix() / portvalue.ix[dates[i-1]:dates[i-1]].as_matrix()) - 1)[0]
+        alpha = alphas[rows[i]] if rows[i] >= 0 else np.nan * np.ones(len(tickers))
+
+        if pairwise:
+            with instrument.span('slice') as sp:
+                lo = active.index.searchsorted(start)
+                hi = active.index.searchsorted(end, side='right')
+                mask = observed[lo:hi]
+                live = membership.mask(start, end) & ~np.isnan(alpha)
+                live[live] = sh.complete_pairs(mask[:, live])
+                window = buffers.take(values[lo:hi], live, drop=False)
+                sp.size(window)
+
+            with instrument.span('covariance') as sp:
+                cov = pandas.DataFrame(sh.pairwise_covariance(window, mask[:, live]), index=tickers[live],
+                    columns=tickers[live])
+                sp.size(cov)
+        else:
+            with instrument.span('slice') as sp:
+                live = membership.mask(start, end) & ~np.isnan(alpha)
+                window = buffers.take(active.ix[start:end].values, live)
+                sp.size(window)
+
+            # compute the sample covariance matrix, cov of active returns of the live tickers; the shrunk
+            # estimator works on the window's returns themselves
+            if type == 'sample':
+                with instrument.span('covariance') as sp:
+                    cov = pandas.DataFrame(buffers.covariance(window), index=tickers[live], columns=tickers[live])
+                    sp.size(cov)
         
+        # a window without a live name with an alpha has nothing to optimize
+        if not live.any():
+            continue
+
         # alphas
         # apparently, cvxopt.matrix requires the input ndarray to be F_CONTIGUOUS which i discovered reading the C source code
         # F_CONTIGUOUS is found in ndarray.flags and is a boolean which ensure a Fortran-contiguous array
         # np.require forces that to be the case; this took me a really long time to figure out
-        a0 = np.require(expected_excess_returns.ix[end:end].transpose().as_matrix(), dtype=np.float64, requirements=['F'])
+        a0 = np.require(alpha[live][:, np.newaxis], dtype=np.float64, requirements=['F'])
         a = matrix(a0)
         
         if type == 'sample':
-            S = matrix(cov.as_matrix())
+            # a pairwise matrix need not be positive definite, so it is checked and repaired like the shrunk one
+            with instrument.span('factorize'):
+                sigma, L, repaired = sh.factorize(cov.as_matrix())
+            S = matrix(sigma)
         elif type == 'shrunk':
-            # compute the shrunk covariance matrix, sigma
-            sigma, shrinkage = port.get_shrunk_covariance_matrix(cov)
+            # compute the shrunk covariance matrix, sigma, with its cholesky factor for the optimizer
+            with instrument.span('shrinkage') as sp:
+                # the estimator needs complete periods, so a pairwise window keeps those of the live tickers
+                if pairwise:
+                    window = window[~np.isnan(window).any(axis=1)]
+                returns = pandas.DataFrame(window, columns=tickers[live])
+                sigma, shrinkage, L = port.get_shrunk_covariance_matrix(returns, shrink, factor=True, path=path,
+                    key=_path_key(tickers, roll, pairwise, target, i), target=target)
+                sp.size(sigma)
             S = matrix(sigma.as_matrix())
         else:
             raise ValueError('Type must be either of the two strings: sample or shrunk')
+
+        if stack is not None:
+            stack.append(i, np.array(S), live)
         
         # get the optimized weights
-        # this is horribly naive because i'm only including the constaints provided in the example
-        # i spent a considerable amount of time looking at the documentation, forums, and source
-        # code trying to become comfortable with the package to no avail
-        x = op.optimize(a, S)
-        
-        # optimized expected active portfolio returns
-        e_ = (x.T * y).sum()
-        e.append(e_)
-        
-        # weighted benchmark returns
-        b = (bench_returns.ix[end:end] * bench_weights.ix[end:end]).sum()
-        
-        # tracking error
-        te.append(e_ - b)
+        # the turnover limit only applies once there is a previous portfolio to trade from
+        with instrument.span('qp'):
+            if x is None or turnover is None:
+                weights = op.optimize(a, S, constraints, factor=L)
+            else:
+                weights = op.optimize(a, S, constraints, previous=x[live], turnover=turnover, factor=L)
+
+        # names outside the index in this window hold no active position
+        x = np.zeros(len(tickers))
+        x[live] = np.array(weights).ravel()
+
+        yield i, x
+
+def _path_key(tickers, roll, pairwise, target, i):
+    """Returns the key of a window in a shrinkage.ShrinkagePath: the universe, roll, pairwise setting and target
+        (by identity) it was estimated with, and the index of its last date"""
+    return (tuple(tickers), roll, pairwise, None if target is None else id(target), i)
+
+def eval(type, index=30, roll=60, resamples=None, outsample=None, path=None, shrink=None, pairwise=False,
+        target=None):
+    """Executes the experiment
+    
+    Parameters
+    ----------
+    type : a string representing the type of covariance matrix to optimize against, either 'sample' or 'shrunk'
+    index : benchmark index size to use
+    roll : length of the rolling estimation window in months
+    resamples : number of block bootstrap resamples for 95% confidence intervals, see stats.bootstrap; none
+        to skip them
+    outsample : number of out-of-sample periods evaluated, the last ones of the data; none for every period
+        after the first window
+    path : optional shrinkage.ShrinkagePath to record the shrinkage terms of every window in, see
+        _rolling_weights; reusing it with shrink reruns at a fixed intensity from the cached matrices
+    shrink : optional fixed shrinkage intensity for 'shrunk'
+    pairwise : estimate on pairwise complete returns instead of dropping periods with missing returns
+    target : optional shrinkage.TargetCache of a structured target for 'shrunk', see _rolling_weights
+    
+    Returns
+    -------
+    dictionary : returns a dictionary with sample statistics for the information ratio, mean excess return,
+        standard deviation of excess returns, and tracking error, and with resamples their interval bounds
+        under the same names suffixed _lower and _upper; for 'shrunk' also the mean shrinkage intensity
+    """
+    # get the portfolio parameters
+    port_params = params.get_portfolio_params(index=index)
+
+    # instantiate the porfolio object
+    port = portfolio.Portfolio(port_params, proxy={}, lazy=True)
+
+    return _evaluate(port, type, port_params['defaults']['frequency'], roll, resamples, outsample, path, shrink,
+        pairwise, target)
+
+def _evaluate(port, type, freq, roll=60, resamples=None, outsample=None, path=None, shrink=None, pairwise=False,
+        target=None):
+    """Backtests an instantiated portfolio, see eval for the parameters and the statistics returned"""
+    with instrument.span('load'):
+        y, b = _realized(port)
+
+    # the intensities are kept even when the caller does not ask for the path
+    if type == 'shrunk' and path is None:
+        path = sh.ShrinkagePath(matrices=False)
+
+    e = []; te = []; windows = [];
+    tickers = port.get_active_returns().columns
+
+    for i, x in _rolling_weights(port, type, roll, outsample=outsample, path=path, shrink=shrink,
+            pairwise=pairwise, target=target):
+        windows.append(i)
+
+        with instrument.span('statistics'):
+            # optimized expected active portfolio returns
+            e_ = np.nansum(x * y[i])
+            e.append(e_)
+            
+            # tracking error against the weighted benchmark return
+            te.append(e_ - b[i])
+
+    with instrument.span('statistics'):
+        res = _statistics(port, e, te, freq, resamples)
+
+        if type == 'shrunk':
+            keys = [_path_key(tickers, roll, pairwise, target, i) for i in windows]
+            res['shrinkage'] = shrink if shrink is not None else \
+                np.mean([path.get_terms(key)['shrinkage'] for key in keys])
+
+        return res
+
+def universes(type, index=[15, 30, 50, 75, 100], roll=60, resamples=None, outsample=None):
+    """Executes the experiment for several benchmark index sizes from a single price load. The largest
+        universe is loaded once and every other one is a column slice of its aligned price matrix (see
+        portfolio.Portfolio.subset); the index sizes of params are nested, so the slices need no data
+        access. Benchmark weights and active returns depend on the universe and are recomputed per slice
+    
+    Parameters
+    ----------
+    type : a string representing the type of covariance matrix to optimize against, either 'sample' or 'shrunk'
+    index : list of benchmark index sizes
+    roll : length of the rolling estimation window in months
+    resamples : number of block bootstrap resamples for 95% confidence intervals, see eval
+    outsample : number of out-of-sample periods, see eval
+    
+    Returns
+    -------
+    dictionary : the statistics of eval keyed by index size
+    """
+    ports = _universes(index)
+    freq = params.get_portfolio_params(index=max(index))['defaults']['frequency']
+
+    res = {}
+    for n in index:
+        res[n] = _evaluate(ports[n], type, freq, roll, resamples, outsample)
+
+    return res
+
+def _universes(index):
+    """Instantiates the portfolio of the largest index size and slices the others out of it
+
+    Returns
+    -------
+    dictionary : portfolio.Portfolio keyed by index size
+    """
+    largest = max(index)
+    port = portfolio.Portfolio(params.get_portfolio_params(index=largest), proxy={}, lazy=True)
+
+    with instrument.span('load'):
+        port.get_trading_dates()
+
+    ports = {largest: port}
+    for n in index:
+        if n not in ports:
+            ports[n] = port.subset(params.get_portfolio_params(index=n)['holding_periods'].keys())
+
+    return ports
+
+def attribute(type, index=30, roll=60, outsample=None):
+    """Runs the experiment and decomposes the ex-ante active risk of every window into the contributions of
+        each name, against the covariance matrix optimized against in that window. The active weights are
+        the optimized weights less the benchmark weights of the window's live names at its last date,
+        rescaled to sum to one over them. The decomposition is one batched product over the stacked matrices
+        of all windows, see risk.decompose
+    
+    Parameters
+    ----------
+    type : a string representing the type of covariance matrix to optimize against, either 'sample' or 'shrunk'
+    index : benchmark index size to use
+    roll : length of the rolling estimation window in months
+    outsample : number of out-of-sample periods, see eval
+    
+    Returns
+    -------
+    dictionary : the ex-ante tracking_error as a pandas.Series indexed by the last date of each window, and
+        the marginal, component and percent contributions as pandas.DataFrames indexed by date with a column
+        per ticker
+    """
+    port_params = params.get_portfolio_params(index=index)
+    port = portfolio.Portfolio(port_params, proxy={}, lazy=True)
+
+    dates = port.get_trading_dates()
+    tickers = port.get_active_returns().columns
+    bench = port.get_benchmark_weights().values
+
+    stack = risk.CovarianceStack(len(tickers))
+    weights = []
+
+    for i, x in _rolling_weights(port, type, roll, outsample=outsample, stack=stack):
+        weights.append(x)
+
+    with instrument.span('attribution'):
+        live = stack.get_live()
+        b = np.where(live, np.nan_to_num(bench[stack.get_keys()]), 0.0)
+        b /= b.sum(axis=1)[:, np.newaxis]
+        res = risk.decompose(stack.get_stack(), np.array(weights) - b)
+
+    index = dates[stack.get_keys()]
 
     return {
-        'information_ratio': port.information_ratio(np.array([e])),
-        'mean_excess_return': np.array([e]).mean(),
-        'stdev_excess_return': np.array([e]).std(),
-        'tracking_error': np.array([te]).std()
+        'tracking_error': pandas.Series(res['tracking_error'], index=index),
+        'marginal': pandas.DataFrame(res['marginal'], index=index, columns=tickers),
+        'component': pandas.DataFrame(res['component'], index=index, columns=tickers),
+        'percent': pandas.DataFrame(res['percent'], index=index, columns=tickers)
     }
 
-def run(runs=10, index=[15, 30, 50, 75, 100]):
+def _realized(port):
+    """Computes the realized returns the backtests are scored on
+
+    Returns
+    -------
+    tuple : T x N numpy.ndarray of period returns of the positions held, T numpy.ndarray of benchmark returns
+        weighted by the benchmark weights of the same date
+
+    """
+    # actual realized returns
+    portvalue = port.get_portfolio_historic_position_values().values
+    y = np.nan * np.ones(np.shape(portvalue))
+    y[1:] = portvalue[1:] / portvalue[:-1] - 1
+
+    # weighted benchmark returns
+    b = np.nansum(port.get_benchmark_returns().values * port.get_benchmark_weights().values, axis=1)
+
+    return y, b
+
+def _statistics(port, e, te, freq, resamples=None):
+    """Summarizes the excess returns e and benchmark relative returns te of a backtest, see eval"""
+    e = np.array(e)
+    te = np.array(te)
+
+    res = {
+        'information_ratio': port.information_ratio(e),
+        'mean_excess_return': e.mean(),
+        'stdev_excess_return': e.std(),
+        'tracking_error': te.std()
+    }
+
+    if resamples is not None:
+        intervals = stats.bootstrap(e, te, resamples, freq=freq)
+        for name, ci in intervals.items():
+            res[name + '_lower'] = ci['lower']
+            res[name + '_upper'] = ci['upper']
+
+    return res
+
+def sweep(type, index=30, windows=range(12, 121, 12), horizons=(60,), resamples=None):
+    """Executes the experiment for every combination of rolling window length and out-of-sample horizon.
+        For each out-of-sample date the windows ending on it are nested, so their moments are accumulated
+        once from the shortest window outwards, each longer window extending the running sums of the one
+        before (see streaming.StreamingCovCor), and the horizons are nested tails of the same out-of-sample
+        returns. The cost is that of the longest window plus one optimization per window and date.
+
+        Unlike eval, the shrunk estimator is the Ledoit-Wolf estimator on the window returns themselves, and
+        periods in which any name of the universe has no return are left out of the moments
+    
+    Parameters
+    ----------
+    type : a string representing the type of covariance matrix to optimize against, either 'sample' or 'shrunk'
+    index : benchmark index size to use
+    windows : rolling window lengths in months
+    horizons : out-of-sample horizons in months, the number of last periods scored
+    resamples : number of block bootstrap resamples for 95% confidence intervals, see eval
+    
+    Returns
+    -------
+    dictionary : the statistics of eval keyed by (window, horizon)
+    """
+    from cvxopt import matrix
+
+    if type not in ('sample', 'shrunk'):
+        raise ValueError('Type must be either of the two strings: sample or shrunk')
+
+    windows = sorted(windows)
+    horizons = sorted(horizons)
+
+    port_params = params.get_portfolio_params(index=index)
+    port = portfolio.Portfolio(port_params, proxy={}, lazy=True)
+
+    with instrument.span('load'):
+        dates = port.get_trading_dates()
+        active = port.get_active_returns().values
+        expected_excess_returns = port.get_expected_excess_stock_returns()
+        y, b = _realized(port)
+
+    # the alphas of each date are looked up by exact date; a date without a row has no alphas
+    alphas = expected_excess_returns.values
+    rows = expected_excess_returns.index.get_indexer(dates)
+
+    membership = port.get_membership()
+    complete = ~np.isnan(active).any(axis=1)
+    t, n = np.shape(active)
+
+    # excess and benchmark relative returns by window and out-of-sample date
+    e = dict((roll, {}) for roll in windows)
+    te = dict((roll, {}) for roll in windows)
+
+    for i in xrange(max(windows[0], t - horizons[-1]), t):
+        est = streaming.StreamingCovCor(n)
+        covered = i + 1
+        alpha = alphas[rows[i]] if rows[i] >= 0 else np.nan * np.ones(n)
+
+        for roll in windows:
+            if roll > i:
+                break
+
+            # extend the moments of the shorter window back to the start of this one
+            with instrument.span('moments'):
+                est.update(active[i-roll:covered][complete[i-roll:covered]])
+                covered = i - roll
+
+            live = membership.mask(dates[i-roll], dates[i]) & ~np.isnan(alpha)
+            x = np.zeros(n)
+
+            # a window without a live name with an alpha has nothing to optimize and holds no position
+            if live.any():
+                with instrument.span('shrinkage'):
+                    if type == 'sample':
+                        sigma = est.covariance(live)
+                    else:
+                        sigma, shrinkage = est.cov_cor(live)
+
+                a = matrix(np.require(alpha[live][:, np.newaxis], dtype=np.float64, requirements=['F']))
+                S = matrix(np.require(sigma, dtype=np.float64, requirements=['F']))
+
+                with instrument.span('qp'):
+                    weights = op.optimize(a, S)
+
+                x[live] = np.array(weights).ravel()
+
+            e[roll][i] = np.nansum(x * y[i])
+            te[roll][i] = e[roll][i] - b[i]
+
+    res = {}
+    for roll in windows:
+        for horizon in horizons:
+            scored = range(max(roll, t - horizon), t)
+            if len(scored) < 2:
+                continue
+            res[(roll, horizon)] = _statistics(port, [e[roll][i] for i in scored], [te[roll][i] for i in scored],
+                port_params['defaults']['frequency'], resamples)
+
+    return res
+
+def walk_forward(type, index=30, linear_cost=0.001, quadratic_cost=0.0, turnover=None, roll=60):
+    """Executes the experiment as a walk-forward simulation: holdings are carried from one period to the next,
+        drift with realized returns and are rebalanced to the optimized weights at the end of every window,
+        paying linear and quadratic transaction costs on the trades
+    
+    Parameters
+    ----------
+    type : a string representing the type of covariance matrix to optimize against, either 'sample' or 'shrunk'
+    index : benchmark index size to use
+    linear_cost : cost per unit of turnover as a fraction of portfolio value
+    quadratic_cost : cost per unit of squared trade size as a fraction of portfolio value
+    turnover : optional limit on the turnover between consecutive optimized portfolios
+    roll : length of the rolling estimation window in months
+    
+    Returns
+    -------
+    dictionary : returns a dictionary with the information ratio (active_information_ratio), mean
+        (mean_active_return) and standard deviation (tracking_error) of the net returns in excess of the
+        benchmark, the mean and standard deviation of the net returns (mean_net_return, stdev_net_return),
+        the mean turnover and total transaction costs; the names differ from those of eval, whose excess
+        returns are the raw portfolio returns
+    """
+    port_params = params.get_portfolio_params(index=index)
+    port = portfolio.Portfolio(port_params, proxy={}, lazy=True)
+
+    returns = port.get_portfolio_historic_returns().values
+    bench_weights = port.get_benchmark_weights().values
+
+    targets = np.nan * np.ones(np.shape(returns))
+    for i, x in _rolling_weights(port, type, roll, port_params['constraints'], turnover):
+        targets[i] = x
+
+    res = simulate.walk_forward(returns[roll:], targets[roll:], linear_cost, quadratic_cost,
+        constraints=port_params['constraints'])
+
+    # benchmark return over each period at the weights held at the start of it
+    bench = np.nansum(bench_weights[roll-1:-1] * returns[roll:], axis=1)
+
+    # the first period only funds the initial positions
+    net = res['net_returns'][1:]
+    active = net - bench[1:]
+
+    return {
+        'active_information_ratio': port.information_ratio(active),
+        'mean_active_return': active.mean(),
+        'tracking_error': active.std(),
+        'mean_net_return': net.mean(),
+        'stdev_net_return': net.std(),
+        'turnover': res['turnover'][1:].mean(),
+        'costs': res['costs'].sum()
+    }
+
+def run(runs=10, index=[15, 30, 50, 75, 100], plot=True, resamples=None):
     """Interface for the execution script
     
     Parameters
     ----------
     runs : number of runs to use to calculate the mean sample statistic
     index : list of benchmark index sizes to use
+    plot : show the information ratio plot at the end; batch runs should use batch.py instead
+    resamples : number of bootstrap resamples per run for the 95% confidence interval of the information
+        ratio, averaged over the runs; none to skip it
 
     """
     cnt = 0
@@ -130,25 +547,33 @@ def run(runs=10, index=[15, 30, 50, 75, 100]):
     p_ir_sa = []; p_mer_sa = []; p_msd_sa = []; p_te_sa = [];
     p_ir_sh = []; p_mer_sh = []; p_msd_sh = []; p_te_sh = [];
 
+    # every index size is a slice of the largest one, loaded once for all runs
+    ports = _universes(index)
+    freq = params.get_portfolio_params(index=max(index))['defaults']['frequency']
+
     for n in index:
 
-        ir_sh = []; me_sh = []; se_sh = []; te_sh = [];
-        ir_sa = []; me_sa = []; se_sa = []; te_sa = [];
+        ir_sh = []; me_sh = []; se_sh = []; te_sh = []; ci_sh = [];
+        ir_sa = []; me_sa = []; se_sa = []; te_sa = []; ci_sa = [];
             
         s = time.time()
         
         for i in xrange(runs):
-            res = eval('sample', index=n)
+            res = _evaluate(ports[n], 'sample', freq, resamples=resamples)
             ir_sa.append(res['information_ratio'])
             me_sa.append(res['mean_excess_return'])
             se_sa.append(res['stdev_excess_return'])
             te_sh.append(res['tracking_error'])
+            if resamples is not None:
+                ci_sa.append((res['information_ratio_lower'], res['information_ratio_upper']))
             
-            res = eval('shrunk', index=n)
+            res = _evaluate(ports[n], 'shrunk', freq, resamples=resamples)
             ir_sh.append(res['information_ratio'])
             me_sh.append(res['mean_excess_return'])
             se_sh.append(res['stdev_excess_return'])
             te_sa.append(res['tracking_error'])
+            if resamples is not None:
+                ci_sh.append((res['information_ratio_lower'], res['information_ratio_upper']))
             
             print 'run #',i+1,'of',runs,'(',round(((i+1.0)/runs),2)*100.0,'% complete)'
         
@@ -167,6 +592,9 @@ def run(runs=10, index=[15, 30, 50, 75, 100]):
         print '\tIR\tMean\tSD\tTE'
         print 'Sample\t%.4f\t%.4f\t%.4f\t%.4f\t' % (p_ir_sa[cnt], p_mer_sa[cnt], p_msd_sa[cnt], p_te_sa[cnt])
         print 'Shrink\t%.4f\t%.4f\t%.4f\t%.4f\t' % (p_ir_sh[cnt], p_mer_sh[cnt], p_msd_sh[cnt], p_te_sh[cnt])
+        if resamples is not None:
+            print 'IR 95%% CI\tSample [%.4f, %.4f]\tShrink [%.4f, %.4f]' % (tuple(np.mean(ci_sa, axis=0)) +
+                tuple(np.mean(ci_sh, axis=0)))
         print 'computed in', round(time.time()-s, 2), 'seconds'
         print 'N=%.0f\tRuns=%.0f' % (n, runs)
         print
@@ -175,7 +603,12 @@ def run(runs=10, index=[15, 30, 50, 75, 100]):
 
     print 'total run', round((time.time()-start)/60.0, 2), 'minutes'
 
-    pylab.plot(N, p_ir_sa, 'r-', N, p_ir_sh, 'b-')
+    if not plot:
+        return
+
+    import pylab
+
+    pylab.plot(index, p_ir_sa, 'r-', index, p_ir_sh, 'b-')
     pylab.xlabel('Index size, N')
     pylab.ylabel('Information Ratio, IR')
     pylab.title('Information Ratio v. Index Size')
@@ -0,0 +1,178 @@
+# standard modules
+from datetime import datetime
+import time
+
+# application specific modules
+import numpy as np
+
+class TradeLog(object):
+
+    def __init__(self, tickers):
+        """Sparse log of share quantity changes, expanded on demand into a dense position matrix
+
+        Parameters
+        ----------
+        tickers : list of ticker symbols; column order of the expanded position matrix
+
+        Usage
+        -------
+        log = TradeLog.from_shares(port_params['shares'], port_params['holding_periods'])
+        log.record('IBM', datetime(1995, 1, 1), -10)
+
+        positions = log.expand(dates)
+
+        """
+        self._tickers = list(tickers)
+        self._columns = dict((t, i) for i, t in enumerate(self._tickers))
+
+        # events are kept in arrival order and sorted lazily on expansion
+        self._dates = []
+        self._cols = []
+        self._qty = []
+
+        # last expansion, extended incrementally while events only arrive after its last date
+        self._cache_dates = None
+        self._cache = None
+        self._cache_events = 0
+
+    @classmethod
+    def from_shares(cls, shares, holding_periods):
+        """Builds a trade log holding a constant share quantity over each holding period
+
+        Parameters
+        ----------
+        shares : dictionary of share quantities keyed by ticker
+        holding_periods : dictionary of start and end dates keyed by ticker
+
+        Returns
+        -------
+        TradeLog : log with one opening trade per ticker
+
+        """
+        log = cls(sorted(shares.keys()))
+        for ticker in log._tickers:
+            log.record(ticker, holding_periods[ticker]['start'], shares[ticker])
+        return log
+
+    def get_tickers(self):
+        """Returns the tickers in column order"""
+        return self._tickers
+
+    def subset(self, tickers):
+        """Returns a trade log of the trades in tickers only, in the column order given
+
+        Parameters
+        ----------
+        tickers : list of ticker symbols, all part of this log
+
+        Returns
+        -------
+        TradeLog : log with the events of tickers in their original arrival order
+
+        """
+        log = TradeLog(tickers)
+
+        cols = np.array(self._cols, dtype=np.intp)
+        remap = -np.ones(len(self._tickers), dtype=np.intp)
+        for ticker in log._tickers:
+            if ticker not in self._columns:
+                raise ValueError('Ticker %s is not part of the trade log' % ticker)
+            remap[self._columns[ticker]] = log._columns[ticker]
+
+        keep = remap[cols] >= 0
+        log._dates = list(np.array(self._dates, dtype=np.float64)[keep])
+        log._cols = list(remap[cols][keep])
+        log._qty = list(np.array(self._qty, dtype=np.float64)[keep])
+
+        return log
+
+    def record(self, ticker, date, quantity):
+        """Records a change in share quantity, effective from date onwards
+
+        Parameters
+        ----------
+        ticker : ticker symbol traded
+        date : datetime object on which the trade takes effect
+        quantity : signed number of shares bought (positive) or sold (negative)
+
+        """
+        if ticker not in self._columns:
+            raise ValueError('Ticker %s is not part of the trade log' % ticker)
+
+        if type(date) != datetime:
+            raise ValueError('Trade date must be datetime object')
+
+        stamp = time.mktime(date.timetuple())
+
+        # a trade before the last expanded date invalidates the cached positions
+        if self._cache_dates is not None and stamp <= self._cache_dates[-1]:
+            self._cache_dates = None
+            self._cache = None
+
+        self._dates.append(stamp)
+        self._cols.append(self._columns[ticker])
+        self._qty.append(float(quantity))
+
+    def _events(self):
+        """Returns the events as arrays sorted by date; the sort is stable so same-day trades keep their order"""
+        dates = np.array(self._dates, dtype=np.float64)
+        cols = np.array(self._cols, dtype=np.intp)
+        qty = np.array(self._qty, dtype=np.float64)
+
+        order = np.argsort(dates, kind='mergesort')
+        return dates[order], cols[order], qty[order]
+
+    def _accumulate(self, stamps, dates, cols, qty, opening):
+        """Cumulates the events onto stamps starting from the opening positions"""
+        deltas = np.zeros((len(stamps), len(self._tickers)))
+
+        # events before the first date fold into the first row, events after the last date are dropped
+        rows = np.searchsorted(stamps, dates, side='right') - 1
+        rows[rows < 0] = 0
+        keep = dates <= stamps[-1]
+        np.add.at(deltas, (rows[keep], cols[keep]), qty[keep])
+
+        positions = np.cumsum(deltas, axis=0)
+        positions += opening
+        return positions
+
+    def expand(self, dates):
+        """Expands the trade log into a dense T x N matrix of share quantities held on each date
+
+        Parameters
+        ----------
+        dates : sorted sequence of datetime objects (e.g. the pandas.Index from Portfolio.get_trading_dates)
+
+        Returns
+        -------
+        numpy.ndarray : T x N matrix of share quantities, columns ordered as get_tickers
+
+        """
+        stamps = np.array([time.mktime(d.timetuple()) for d in dates], dtype=np.float64)
+
+        if len(stamps) == 0:
+            return np.zeros((0, len(self._tickers)))
+
+        cached = self._cache_dates
+        events = len(self._qty)
+
+        # same dates and no new events
+        if cached is not None and events == self._cache_events and np.array_equal(cached, stamps):
+            return self._cache
+
+        dates_, cols, qty = self._events()
+
+        # the new dates extend the cached ones: only cumulate the tail from the last cached row
+        if cached is not None and len(stamps) > len(cached) and np.array_equal(stamps[:len(cached)], cached):
+            tail = stamps[len(cached):]
+            fresh = dates_ > cached[-1]
+            positions = np.vstack((self._cache,
+                self._accumulate(tail, dates_[fresh], cols[fresh], qty[fresh], self._cache[-1])))
+        else:
+            positions = self._accumulate(stamps, dates_, cols, qty, 0.0)
+
+        self._cache_dates = stamps
+        self._cache = positions
+        self._cache_events = events
+
+        return positions
@@ -5,14 +5,16 @@ import urllib2
 import os
 
 #related third party imports
-from matplotlib.cbook import iterable
-from matplotlib import verbose, get_configdir
-import matplotlib.mlab as mlab
+# matplotlib is imported where it is used so that importing the module stays cheap; pytables by store
+import numpy as np
 try:
     from hashlib import md5
 except ImportError:
     from md5 import md5 #Deprecated in 2.5
-import tables
+
+# custom modules
+import resample
+import store
 
 class InsertPriceHist(object):
     
@@ -33,6 +35,9 @@ class InsertPriceHist(object):
 
         a file handle is returned
         """
+        from matplotlib.cbook import iterable
+        from matplotlib import verbose, get_configdir
+
         if freq is None or type(freq) != str:
             raise ValueError('Must enter a frequency as a string, m, w, or d')
 
@@ -79,58 +84,112 @@ class InsertPriceHist(object):
 
         return fh
 
-    def insert(self, ticker, start, end, frequency):
-        """Inserts frequency price data for ticker from start to end
+    def _append(self, price_data, ticker, frequency, dates, bars):
+        """Appends bars (columns open, high, low, close, volume, adjusted close) for ticker to the table"""
+        now = time.time()
+        newrow = price_data.row
+
+        for date, bar in zip(dates, bars):
+            newrow['ticker'] = ticker
+            newrow['frequency'] = frequency
+            newrow['date'] = date
+            newrow['open'] = bar[0]
+            newrow['high'] = bar[1]
+            newrow['low'] = bar[2]
+            newrow['close'] = bar[3]
+            newrow['volume'] = bar[4]
+            newrow['adjustedClose'] = bar[5]
+            newrow['timestamp'] = now
+
+            newrow.append()
+
+    def _remove(self, price_data, coords):
+        """Removes the rows at coords from the table, one contiguous run at a time from the end so the
+            remaining coordinates stay valid"""
+        coords = np.sort(coords)
+        if len(coords) == 0:
+            return
+
+        breaks = np.flatnonzero(np.diff(coords) != 1) + 1
+        for run in reversed(np.split(coords, breaks)):
+            price_data.removeRows(int(run[0]), int(run[-1]) + 1)
+
+    def _derive(self, price_data, ticker, since):
+        """Rebuilds the weekly, monthly and yearly bars of ticker for every period from the one containing
+            since onwards out of the daily bars in the table"""
+        daily = price_data.readWhere('(frequency == \'d\') & (ticker == \'%s\')' % ticker)
+        daily = daily[np.argsort(daily['date'], kind='mergesort')]
+
+        dates = daily['date'].astype(np.float64)
+        bars = np.column_stack([daily[c].astype(np.float64) for c in
+            ('open', 'high', 'low', 'close', 'volume', 'adjustedClose')])
+
+        for frequency in resample.FREQUENCIES:
+            keys = resample.period_keys(dates, frequency)
+            first = np.searchsorted(keys, resample.period_keys([since], frequency)[0])
+
+            if first == len(dates):
+                continue
+
+            # the bars of the affected periods are dated from the first daily bar in them
+            cutoff = dates[first]
+            stale = price_data.getWhereList('(frequency == \'%s\') & (ticker == \'%s\') & (date >= cutoff)'
+                % (frequency, ticker))
+            self._remove(price_data, stale)
+
+            self._append(price_data, ticker, frequency, *resample.resample(dates[first:], bars[first:], frequency))
+
+    def insert(self, ticker, start, end, frequency='d'):
+        """Inserts daily price data for ticker from start to end and derives the weekly, monthly and yearly
+            bars from it locally. Days already in the table are skipped, and derived bars of the periods the
+            new days fall in are rebuilt, so repeated or extending inserts keep every frequency consistent
         
         Parameters
         ----------
         ticker : ticker symbol for which to insert data
         start : start date for data acquisition
         end : end date for data acquisition
-        frequency : frequncy of data to acquire {d, w, m, y}
+        frequency : frequncy of data the caller is after {d, w, m, y}; all of them are stored
         
         Returns
         -------
         boolean : true on success, false on failure
         
         """
-        # error checking here
-        
-        h5f = tables.openFile('price_data.h5', 'a')
-        price_data = h5f.getNode('/price_data')
-        
-        fh = self._fetch_historical_yahoo(ticker, start, end, frequency)
+        import matplotlib.mlab as mlab
+
+        if frequency not in ('d',) + resample.FREQUENCIES:
+            raise ValueError('Frequency must be one of d, w, m or y')
+
+        # download before taking the writer lock, which blocks every reader of the store
+        fh = self._fetch_historical_yahoo(ticker, start, end, 'd')
         # converts lines in a csv to a record
         row = list(mlab.csv2rec(fh))
         fh.close()
 
-        # loop through each item in the result set
-        for item in row:
+        dates = np.array([time.mktime(time.strptime(item[0].strftime("%Y-%m-%d"), "%Y-%m-%d")) for item in row])
+        bars = np.array([list(item)[1:7] for item in row], dtype=np.float64).reshape((len(row), 6))
 
-            k = list(item)
+        # yahoo serves newest first
+        order = np.argsort(dates, kind='mergesort')
+        dates = dates[order]
+        bars = bars[order]
 
-            # insert the frequency
-            k.insert(1, frequency)
+        try:
+            with store.writer() as h5f:
+                price_data = h5f.getNode('/price_data')
 
-            newrow = price_data.row
+                # skip the days already stored
+                stored = price_data.readWhere('(frequency == \'d\') & (ticker == \'%s\')' % ticker)['date']
+                new = ~np.in1d(dates.astype(np.int64), stored.astype(np.int64))
 
-            newrow['ticker'] = ticker
-            newrow['frequency'] = k[1]
-            newrow['date'] = time.mktime(time.strptime(k[0].strftime("%Y-%m-%d"), "%Y-%m-%d"))
-            newrow['open'] = k[2]
-            newrow['high'] = k[3]
-            newrow['low'] = k[4]
-            newrow['close'] = k[5]
-            newrow['volume'] = k[6]
-            newrow['adjustedClose'] = k[7]
-            newrow['timestamp'] = time.time() 
+                if new.any():
+                    self._append(price_data, ticker, 'd', dates[new], bars[new])
+                    price_data.flush()
 
-            newrow.append()
+                    self._derive(price_data, ticker, dates[new][0])
 
-        try:
-            price_data.flush()
-            h5f.close()
             return True
 
         except:
-            return False
\ No newline at end of file
+            return False
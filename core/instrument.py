@@ -0,0 +1,219 @@
+# standard modules
+from contextlib import contextmanager
+import atexit
+import json
+import os
+import threading
+import time
+
+# application specific modules
+import numpy as np
+
+__all__ = ["span", "profiling", "enable", "disable", "is_enabled", "reset", "get_stats", "to_json", "to_folded"]
+
+# spans are recorded only while enabled; COVSHRINK_PROFILE=1 turns recording on for the whole process
+_enabled = os.environ.get('COVSHRINK_PROFILE', '') not in ('', '0')
+
+# inclusive durations and allocation sizes keyed by the stack of span names, e.g. ('eval', 'window', 'qp')
+_records = {}
+_lock = threading.Lock()
+_local = threading.local()
+
+class _NullSpan(object):
+    """Span handed out while recording is off; entering, leaving and sizing it does nothing"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def size(self, obj):
+        pass
+
+_NULL = _NullSpan()
+
+class _Span(object):
+
+    def __init__(self, name):
+        self._name = name
+        self._bytes = 0
+
+    def __enter__(self):
+        stack = getattr(_local, 'stack', None)
+        if stack is None:
+            stack = _local.stack = []
+        stack.append(self._name)
+        self._path = tuple(stack)
+        self._start = time.time()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.time() - self._start
+        _local.stack.pop()
+
+        with _lock:
+            record = _records.get(self._path)
+            if record is None:
+                record = _records[self._path] = {'durations': [], 'bytes': 0, 'max_bytes': 0}
+            record['durations'].append(elapsed)
+            record['bytes'] += self._bytes
+            record['max_bytes'] = max(record['max_bytes'], self._bytes)
+
+        return False
+
+    def size(self, obj):
+        """Adds the size of an allocation made inside the span
+
+        Parameters
+        ----------
+        obj : number of bytes, or a numpy.ndarray / pandas object whose data size is counted
+
+        """
+        if hasattr(obj, 'nbytes'):
+            self._bytes += obj.nbytes
+        elif hasattr(obj, 'values'):
+            self._bytes += obj.values.nbytes
+        else:
+            self._bytes += int(obj)
+
+def span(name):
+    """Times the enclosed block under name, nested inside the spans already open in this thread
+
+    Usage
+    -------
+    with instrument.span('covariance') as s:
+        cov = port.get_covariance_matrix(active_returns)
+        s.size(cov)
+
+    """
+    if not _enabled:
+        return _NULL
+    return _Span(name)
+
+def enable():
+    """Starts recording spans"""
+    global _enabled
+    _enabled = True
+
+def disable():
+    """Stops recording spans, keeping what was recorded"""
+    global _enabled
+    _enabled = False
+
+def is_enabled():
+    return _enabled
+
+def reset():
+    """Drops everything recorded so far"""
+    with _lock:
+        _records.clear()
+
+@contextmanager
+def profiling(clear=True):
+    """Records spans inside the with block
+
+    Usage
+    -------
+    with instrument.profiling():
+        eval.eval('shrunk', index=30)
+    print instrument.to_json()
+
+    """
+    global _enabled
+    was = _enabled
+    if clear:
+        reset()
+    _enabled = True
+    try:
+        yield
+    finally:
+        _enabled = was
+
+def get_stats():
+    """Summarizes the recorded spans
+
+    Returns
+    -------
+    dictionary : statistics keyed by the span path joined with '/': count, total, min, max, mean, p50, p90
+        and p99 in seconds, self (total less the time in nested spans), bytes and max_bytes
+
+    """
+    with _lock:
+        records = dict((path, dict(r, durations=np.array(r['durations']))) for path, r in _records.items())
+
+    stats = {}
+    for path, r in records.items():
+        d = r['durations']
+        children = sum(c['durations'].sum() for p, c in records.items() if len(p) == len(path) + 1 and p[:-1] == path)
+        stats['/'.join(path)] = {
+            'count': len(d),
+            'total': d.sum(),
+            'self': max(0.0, d.sum() - children),
+            'min': d.min(),
+            'max': d.max(),
+            'mean': d.mean(),
+            'p50': np.percentile(d, 50),
+            'p90': np.percentile(d, 90),
+            'p99': np.percentile(d, 99),
+            'bytes': r['bytes'],
+            'max_bytes': r['max_bytes']
+        }
+
+    return stats
+
+def to_json(path=None):
+    """Exports the span statistics as json
+
+    Parameters
+    ----------
+    path : optional file to write to
+
+    Returns
+    -------
+    string : the json document
+
+    """
+    doc = json.dumps(get_stats(), indent=2, sort_keys=True)
+
+    if path is not None:
+        fh = open(path, 'w')
+        fh.write(doc)
+        fh.close()
+
+    return doc
+
+def to_folded(path=None):
+    """Exports the spans in the folded stack format read by flamegraph.pl and speedscope, one line per span
+        path with its self time in microseconds
+
+    Parameters
+    ----------
+    path : optional file to write to
+
+    Returns
+    -------
+    string : the folded stacks
+
+    """
+    stats = get_stats()
+    lines = ['%s %d' % (name.replace('/', ';'), round(s['self'] * 1e6)) for name, s in sorted(stats.items())]
+    doc = '\n'.join(lines) + '\n'
+
+    if path is not None:
+        fh = open(path, 'w')
+        fh.write(doc)
+        fh.close()
+
+    return doc
+
+def _dump():
+    """Writes the spans to COVSHRINK_PROFILE_OUTPUT at exit, folded if it ends in .folded and json otherwise"""
+    path = os.environ.get('COVSHRINK_PROFILE_OUTPUT')
+    if path and _records:
+        if path.endswith('.folded'):
+            to_folded(path)
+        else:
+            to_json(path)
+
+atexit.register(_dump)
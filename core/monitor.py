@@ -0,0 +1,170 @@
+# application specific modules
+import numpy as np
+
+class ActiveRiskMonitor(object):
+
+    def __init__(self, sigma, shares, benchmark_shares, prices, resync=10000):
+        """Ex-ante tracking error of a portfolio against its benchmark, kept current as prices tick. With
+            dollar positions u = shares * prices, the monitor holds g = sigma u for the portfolio and the
+            benchmark and the three quadratic forms uP'sigma uP, uP'sigma uB and uB'sigma uB. A tick in K
+            names changes them by a rank-K correction costing O(N K) instead of the O(N^2) of w'sigma w
+
+        Parameters
+        ----------
+        sigma : N x N numpy.ndarray covariance matrix of returns, e.g. the cached shrunk covariance matrix
+        shares : N numpy.ndarray of portfolio share quantities
+        benchmark_shares : N numpy.ndarray of benchmark share quantities
+        prices : N numpy.ndarray of current prices
+        resync : number of ticks after which the state is recomputed in full to shed rounding drift
+
+        Usage
+        -------
+        mon = ActiveRiskMonitor.from_portfolio(port, sigma)
+        poller.subscribe(lambda p: mon.update(p.latest('LastTradePriceOnly')))
+        print mon.get_tracking_error()
+
+        """
+        self._sigma = np.require(sigma, dtype=np.float64, requirements=['F'])
+        self._diag = np.diag(self._sigma).copy()
+        self._h = np.array(shares, dtype=np.float64)
+        self._b = np.array(benchmark_shares, dtype=np.float64)
+        self._p = np.array(prices, dtype=np.float64)
+        self._resync = resync
+
+        if np.isnan(self._p).any():
+            raise ValueError('Initial prices must all be given')
+
+        self.refresh()
+
+    @classmethod
+    def from_portfolio(cls, port, sigma, resync=10000):
+        """Builds the monitor from the latest portfolio and benchmark weights (get_benchmark_weights) and
+            prices of a portfolio.Portfolio; weights are turned into share quantities per unit of value
+
+        Parameters
+        ----------
+        port : portfolio.Portfolio
+        sigma : N x N pandas.DataFrame covariance matrix labelled by ticker, the names monitored
+
+        Returns
+        -------
+        ActiveRiskMonitor : the monitor, in the column order of sigma
+
+        """
+        tickers = list(sigma.columns)
+
+        dates, columns, prices = port._get_price_matrix()
+        prices = prices[-1][[columns.index(t) for t in tickers]]
+
+        weights = port.get_portfolio_weights()[tickers].values[-1]
+        bench = port.get_benchmark_weights()[tickers].values[-1]
+
+        return cls(sigma.values, weights / prices, bench / prices, prices, resync)
+
+    def refresh(self):
+        """Recomputes the state in full from the holdings and prices"""
+        self._uP = self._h * self._p
+        self._uB = self._b * self._p
+        self._vP = self._uP.sum()
+        self._vB = self._uB.sum()
+
+        self._gP = np.dot(self._sigma, self._uP)
+        self._gB = np.dot(self._sigma, self._uB)
+        self._qPP = np.dot(self._uP, self._gP)
+        self._qPB = np.dot(self._uP, self._gB)
+        self._qBB = np.dot(self._uB, self._gB)
+
+        self._ticks = 0
+
+    def _apply(self, k, dP, dB):
+        """Adds dP and dB to the dollar positions in names k and updates the state by a rank-len(k) correction"""
+        S = self._sigma[np.ix_(k, k)]
+        gP = self._gP[k]
+        gB = self._gB[k]
+
+        self._qPP += 2.0 * np.dot(dP, gP) + np.dot(dP, np.dot(S, dP))
+        self._qPB += np.dot(dP, gB) + np.dot(dB, gP) + np.dot(dP, np.dot(S, dB))
+        self._qBB += 2.0 * np.dot(dB, gB) + np.dot(dB, np.dot(S, dB))
+
+        cols = self._sigma[:, k]
+        self._gP += np.dot(cols, dP)
+        self._gB += np.dot(cols, dB)
+
+        self._uP[k] += dP
+        self._uB[k] += dB
+        self._vP += dP.sum()
+        self._vB += dB.sum()
+
+        self._ticks += 1
+        if self._ticks >= self._resync:
+            self.refresh()
+
+    def tick(self, k, price):
+        """Updates the state for a new price of name k, a rank-one correction in O(N)"""
+        if price == self._p[k] or np.isnan(price):
+            return
+
+        change = price - self._p[k]
+        self._p[k] = price
+
+        dP = self._h[k] * change
+        dB = self._b[k] * change
+        s = self._diag[k]
+        gP = self._gP[k]
+        gB = self._gB[k]
+
+        self._qPP += 2.0 * dP * gP + dP * dP * s
+        self._qPB += dP * gB + dB * gP + dP * dB * s
+        self._qBB += 2.0 * dB * gB + dB * dB * s
+
+        # sigma is fortran ordered, so its columns are contiguous
+        col = self._sigma[:, k]
+        self._gP += dP * col
+        self._gB += dB * col
+
+        self._uP[k] += dP
+        self._uB[k] += dB
+        self._vP += dP
+        self._vB += dB
+
+        self._ticks += 1
+        if self._ticks >= self._resync:
+            self.refresh()
+
+    def update(self, prices):
+        """Updates the state for a row of prices, e.g. poller.Poller.latest; only the names whose price
+            changed are touched and NaN prices are ignored
+
+        Parameters
+        ----------
+        prices : N numpy.ndarray of the latest prices
+
+        """
+        k = np.flatnonzero((prices != self._p) & ~np.isnan(prices))
+        if len(k) == 0:
+            return
+
+        change = prices[k] - self._p[k]
+        self._p[k] = prices[k]
+        self._apply(k, self._h[k] * change, self._b[k] * change)
+
+    def trade(self, k, quantity):
+        """Updates the state for a trade of quantity shares of name k, a rank-one correction"""
+        self._h[k] += quantity
+        self._apply(np.array([k]), np.array([quantity * self._p[k]]), np.zeros(1))
+
+    def get_tracking_error(self):
+        """Returns the ex-ante tracking error, sqrt(a'sigma a) for a the active weights, in O(1)"""
+        vP = self._vP
+        vB = self._vB
+        te2 = self._qPP / (vP * vP) - 2.0 * self._qPB / (vP * vB) + self._qBB / (vB * vB)
+        return np.sqrt(max(te2, 0.0))
+
+    def get_active_weights(self):
+        """Returns the N active weights, portfolio less benchmark"""
+        return self._uP / self._vP - self._uB / self._vB
+
+    def get_marginal_contributions(self):
+        """Returns the N marginal contributions to tracking error, sigma a / TE; multiplied by the active
+            weights they sum to the tracking error"""
+        return (self._gP / self._vP - self._gB / self._vB) / self.get_tracking_error()
@@ -1,50 +1,160 @@
 # standard modules
-from math import sqrt
+import warnings
 
 # application specific modules
-from cvxopt import matrix
-from cvxopt.blas import dot
-from cvxopt import solvers
-from cvxopt.solvers import qp
+# cvxopt is imported on the first solve so that importing the module stays cheap
 import numpy as np
 
 # custom modules
-import params
-import portfolio
+import shrinkage as sh
 
-# turn off display of optimizations
-solvers.options['show_progress'] = False
-
-def optimize(a, S):
-    """
+def position_bounds(n, constraints=None):
+    """Computes the lower and upper bound on each position from the portfolio constraints. A feasible bound
+        is kept as given. A bound that would make a fully invested portfolio of n names infeasible, e.g. a 5%
+        minimum position in a 100 name index, is dropped with a warning: relaxing it to 1 / n instead would
+        pin every weight at 1 / n and leave nothing to optimize
     
     Parameters
     ----------
+    n : number of assets in the portfolio
+    constraints : dictionary with optional min_position and max_position as in params.get_portfolio_params
     
     Returns
     -------
-    
+    tuple : float lower bound, float upper bound
     
     """
-    # get the required metrix for the opmization
-    n = np.shape(S)[0]
+    if constraints is None:
+        constraints = {}
+
+    lower = constraints.get('min_position', 0.0)
+    upper = constraints.get('max_position', 1.0)
+
+    if n * lower > 1.0:
+        warnings.warn('Minimum position %g is infeasible for %d names and is dropped' % (lower, n))
+        lower = 0.0
+
+    if n * upper < 1.0:
+        warnings.warn('Maximum position %g is infeasible for %d names and is dropped' % (upper, n))
+        upper = 1.0
+
+    return lower, upper
+
+def _best_gain(a, lower, upper):
+    """Computes the highest expected excess return a'x of a fully invested portfolio within the position
+        bounds by filling the names with the highest expected return first"""
+    alphas = np.sort(np.array(a, dtype=np.float64).ravel())[::-1]
+    room = 1.0 - len(alphas) * lower
+
+    fill = np.clip(room - (upper - lower) * np.arange(len(alphas)), 0.0, upper - lower)
+    return np.dot(alphas, lower + fill)
+
+def _constraints(n, a, constraints=None, previous=None, turnover=None, target=True):
+    """Builds the sparse inequality and equality constraints of the QP. With a turnover limit the problem is
+        lifted to z = [x; u] where u bounds |x - previous| elementwise
     
-    # n x n matrix of zeros
-    G = matrix(0.0, (n,n)) #original
+    Parameters
+    ----------
+    n : number of assets
+    a : n x 1 cvxopt.matrix of expected excess returns
+    constraints : dictionary with optional min_position, max_position and target_gain
+    previous : n x 1 cvxopt.matrix or numpy.ndarray of the weights currently held
+    turnover : limit on sum(|x - previous|)
+    target : whether to include the target_gain constraint
+    
+    Returns
+    -------
+    tuple : cvxopt.spmatrix G, cvxopt.matrix h, cvxopt.spmatrix A, cvxopt.matrix b
+    
+    """
+    from cvxopt import matrix
+    from cvxopt import spmatrix
+
+    if constraints is None:
+        constraints = {}
+
+    lifted = turnover is not None
+    m = 2 * n if lifted else n
+    lower, upper = position_bounds(n, constraints)
 
-    # diagonal matrix with -1.0 in the diagonal
-    G[::n+1] = -1.0 #new
+    # triplets of the sparse G, rows are appended block by block
+    vals = []; rows = []; cols = []; h = []
+    assets = list(range(n))
 
-    # n x 1 matrix of 0.0s
-    # this appears to be the constraint that x >= 0
-    h = matrix(0.0, (n,1)) # original
+    # x >= lower
+    vals += [-1.0] * n; rows += assets; cols += assets; h += [-lower] * n
+    r = n
 
-    # 1 x n matrix of 1.0s
-    # this appears to be the constraint that 1Tx = 1
-    A = matrix(1.0, (1,n))
+    # x <= upper
+    if upper < 1.0:
+        vals += [1.0] * n; rows += list(range(r, r+n)); cols += assets; h += [upper] * n
+        r += n
 
-    # 1 x 1 matrix of 1.0s
-    b = matrix(1.0)
+    # x - u <= previous, -x - u <= -previous, 1'u <= turnover
+    if lifted:
+        if previous is None:
+            raise ValueError('Previous weights are required for a turnover limit')
+        x0 = list(np.array(previous, dtype=np.float64).ravel())
+        lifts = list(range(n, 2*n))
+
+        vals += [1.0] * n + [-1.0] * n; rows += list(range(r, r+n)) * 2; cols += assets + lifts; h += x0
+        r += n
+        vals += [-1.0] * n + [-1.0] * n; rows += list(range(r, r+n)) * 2; cols += assets + lifts; h += [-v for v in x0]
+        r += n
+        vals += [1.0] * n; rows += [r] * n; cols += lifts; h += [float(turnover)]
+        r += 1
+
+    # a'x >= target_gain, unless no portfolio within the bounds can reach it
+    if target and constraints.get('target_gain') is not None and \
+            _best_gain(a, lower, upper) >= constraints['target_gain']:
+        vals += list(-np.array(a).ravel()); rows += [r] * n; cols += assets; h += [-constraints['target_gain']]
+        r += 1
+
+    G = spmatrix(vals, rows, cols, (r, m))
+
+    # 1'x = 1
+    A = spmatrix(1.0, [0] * n, assets, (1, m))
+
+    return G, matrix(h, (r, 1)), A, matrix(1.0)
+
+def optimize(a, S, constraints=None, previous=None, turnover=None, factor=None):
+    """Finds the weights trading off expected excess return against risk, mu / 2 * x'Sx - a'x, for a fully
+        invested long only portfolio. Constraints are passed to cvxopt as sparse matrices so their cost
+        grows with the number of nonzeros rather than n^2
+    
+    Parameters
+    ----------
+    a : n x 1 cvxopt.matrix of expected excess returns
+    S : n x n cvxopt.matrix covariance matrix
+    constraints : optional dictionary as in params.get_portfolio_params with min_position and max_position
+        (box bounds on each weight, see position_bounds) and target_gain (minimum expected excess return
+        a'x, dropped when it can't be met)
+    previous : weights currently held, required with turnover
+    turnover : optional limit on sum(|x - previous|), dropped when no optimal portfolio satisfies it
+    factor : optional Cholesky factor of S, e.g. from Portfolio.get_shrunk_covariance_matrix; without it S is
+        factorized here and repaired if it is not positive definite
+    
+    Returns
+    -------
+    cvxopt.matrix : n x 1 matrix of optimized weights; ValueError is raised if no solve is optimal even
+        without the target gain and the turnover limit
+    
+    """
+    from cvxopt import matrix
+    from cvxopt import solvers
+
+    # turn off display of optimizations
+    solvers.options['show_progress'] = False
+
+    # get the required metrix for the opmization
+    n = np.shape(S)[0]
+
+    # a singular S (fewer periods than assets) leaves the solver iterating or failing, a factor from the
+    # caller already vouches for S
+    if factor is None:
+        S_, factor, repaired = sh.factorize(np.array(S))
+        if repaired:
+            S = matrix(S_)
 
     # Compute trade-off.
     N = 1
@@ -54,11 +164,53 @@ def optimize(a, S):
     #mus = [ 10**(5.0*t/N-1.0) for t in xrange(N) ]
     mu = 10**(5.0*t/N-1.0)
 
-    # optimal portfolios for given mus
-    #portfolios = [ qp(mu*S, -pbar, G, h, A, b)['x'] for mu in mus ]
-    portfolios = qp(mu*S, -a, G, h, A, b)['x']
+    # the target gain is a wish rather than a requirement and the turnover limit may not be reachable from
+    # the weights held, so they are given up in that order until a solve is optimal
+    attempts = [(turnover, True)]
+    if constraints is not None and constraints.get('target_gain') is not None:
+        attempts.append((turnover, False))
+    if turnover is not None:
+        attempts.append((None, False))
 
-    #returns = [ dot(pbar,x) for x in portfolios ]
-    #risks = [ sqrt(dot(x, S*x)) for x in portfolios ]
-    
-    return portfolios
\ No newline at end of file
+    for limit, target in attempts:
+        sol = _solve(mu, a, S, n, constraints, previous, limit, target)
+        if sol is not None:
+            #returns = [ dot(pbar,x) for x in portfolios ]
+            #risks = [ sqrt(dot(x, S*x)) for x in portfolios ]
+            return sol['x'][:n]
+
+    raise ValueError('No optimal portfolio found, even without the target gain and turnover limit')
+
+def _solve(mu, a, S, n, constraints, previous, turnover, target):
+    """Solves the QP once, see optimize
+
+    Returns
+    -------
+    dictionary : the cvxopt solution, or none if the solver failed or the solution is not optimal
+
+    """
+    from cvxopt import matrix
+    from cvxopt.solvers import qp
+
+    m = 2 * n if turnover is not None else n
+
+    # the lifted turnover variables carry no risk or return
+    if m == n:
+        P = S
+        q = -a
+    else:
+        P = matrix(0.0, (m, m))
+        P[:n, :n] = S
+        q = matrix(0.0, (m, 1))
+        q[:n] = -a
+
+    G, h, A, b = _constraints(n, a, constraints, previous, turnover, target)
+    try:
+        sol = qp(mu*P, q, G, h, A, b)
+    except (ArithmeticError, ValueError):
+        return None
+
+    if sol['status'] != 'optimal' or sol['x'] is None:
+        return None
+
+    return sol
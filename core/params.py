@@ -2,7 +2,6 @@ from datetime import datetime
 from datetime import date
 from dateutil import relativedelta
 import numpy as np
-from itertools import islice
 
 def get_portfolio_params(index=30, start=None, end=None):
     
@@ -421,13 +420,19 @@ def get_portfolio_params(index=30, start=None, end=None):
     defaults = {
         'frequency': 'm',
         'start': start,
-        'end': end
+        'end': end,
+        'fill': 'ffill',
+        'fill_limit': 3
     }
 
+    # the first index tickers in sorted order, so the selection does not depend on dictionary ordering and
+    # every smaller universe is nested in the larger ones
+    tickers = sorted(holding_periods.keys())[:index]
+
     return {
-        'expected_returns': dict(list(islice(expected_returns.iteritems(), index))),
-        'holding_periods':dict(list(islice(holding_periods.iteritems(), index))),
-        'shares': dict(list(islice(shares.iteritems(), index))),
+        'expected_returns': dict((t, expected_returns[t]) for t in tickers),
+        'holding_periods': dict((t, holding_periods[t]) for t in tickers),
+        'shares': dict((t, shares[t]) for t in tickers),
         'constraints': constraints,
         'defaults': defaults
     }
\ No newline at end of file
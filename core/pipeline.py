@@ -0,0 +1,49 @@
+# application specific modules
+import numpy as np
+
+def compute(prices, shares):
+    """Computes position values, weights and returns for the portfolio and the benchmark in a single pass
+        over an aligned price matrix. The benchmark holds one share of each constituent, the same convention
+        used by Portfolio.get_benchmark_weights.
+
+    Parameters
+    ----------
+    prices : T x N numpy.ndarray of adjusted close prices with T dates and N assets, NaN where missing
+    shares : N numpy.ndarray of share quantities, or a T x N numpy.ndarray of historic share quantities
+
+    Returns
+    -------
+    dictionary : T x N numpy.ndarrays keyed by position_values, portfolio_weights, benchmark_weights,
+        active_weights, returns and active_returns, plus the T numpy.ndarray portfolio_values
+
+    """
+    prices = np.asarray(prices, dtype=np.float64)
+    shares = np.asarray(shares, dtype=np.float64)
+
+    if prices.ndim != 2:
+        raise ValueError('Prices must be a T x N matrix')
+
+    # returns of the constituents are the same for the portfolio and the benchmark
+    returns = np.empty_like(prices)
+    returns[0] = np.nan
+    np.divide(prices[1:], prices[:-1], out=returns[1:])
+    returns[1:] -= 1.0
+
+    # missing prices are skipped in the totals, as pandas.DataFrame.sum does
+    values = prices * shares
+    portfolio_values = np.nansum(values, axis=1)
+    benchmark_values = np.nansum(prices, axis=1)
+
+    portfolio_weights = values / portfolio_values[:, np.newaxis]
+    benchmark_weights = prices / benchmark_values[:, np.newaxis]
+    active_weights = portfolio_weights - benchmark_weights
+
+    return {
+        'position_values': values,
+        'portfolio_values': portfolio_values,
+        'portfolio_weights': portfolio_weights,
+        'benchmark_weights': benchmark_weights,
+        'active_weights': active_weights,
+        'returns': returns,
+        'active_returns': active_weights * returns
+    }
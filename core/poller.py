@@ -0,0 +1,228 @@
+# standard modules
+import Queue
+import random
+import threading
+import time
+
+# application specific modules
+import numpy as np
+
+# custom modules
+import yahoo
+
+# quote fields kept for every symbol, as named by the yahoo quotes table
+FIELDS = ('LastTradePriceOnly', 'Bid', 'Ask', 'Volume')
+
+class RingBuffer(object):
+
+    def __init__(self, capacity, width):
+        """Fixed size buffer of the last capacity rows of width values, preallocated so that appending and
+            reading the latest row never allocate
+
+        Parameters
+        ----------
+        capacity : number of rows kept
+        width : number of values per row, e.g. one per symbol
+
+        """
+        if capacity < 1:
+            raise ValueError('Capacity must be at least one')
+
+        self._data = np.nan * np.ones((capacity, width))
+        self._capacity = capacity
+        self._count = 0
+
+    def __len__(self):
+        return min(self._count, self._capacity)
+
+    def append(self, row):
+        """Overwrites the oldest row with row"""
+        self._data[self._count % self._capacity] = row
+        self._count += 1
+
+    def latest(self):
+        """Returns a view of the latest row, valid until the buffer wraps around to it"""
+        if self._count == 0:
+            raise ValueError('The buffer is empty')
+        return self._data[(self._count - 1) % self._capacity]
+
+    def last(self, k):
+        """Returns a copy of the last k rows, oldest first"""
+        k = min(k, len(self))
+        rows = np.arange(self._count - k, self._count) % self._capacity
+        return self._data[rows]
+
+class Poller(object):
+
+    def __init__(self, tickers, interval=5.0, fields=FIELDS, capacity=1024, backlog=4, max_backoff=300.0,
+            fetch=None, base=yahoo.YQL):
+        """Polls quotes for a set of symbols on a background thread and keeps the last capacity ticks of each
+            field in a ring buffer. A second thread moves fetched quotes from a bounded queue into the
+            buffers, so a slow consumer holds the poller back instead of piling up quotes. Failed fetches
+            are retried after an exponential backoff with full jitter
+
+        Parameters
+        ----------
+        tickers : list of ticker symbols, the column order of the buffers
+        interval : seconds between polls
+        fields : quote fields to keep, see FIELDS
+        capacity : number of ticks kept per field
+        backlog : number of fetched quotes that may wait for the buffers before polling pauses
+        max_backoff : longest wait in seconds between retries
+        fetch : function of the ticker list returning quote dictionaries keyed by upper case symbol;
+            defaults to yahoo.fetch_quotes against base
+        base : url of the quotes endpoint, e.g. a local stub server
+
+        Usage
+        -------
+        poller = Poller(['AAPL', 'MSFT'], interval=1.0)
+        prices = np.empty(2)
+        poller.subscribe(lambda p: monitor.update(p.latest_into('LastTradePriceOnly', prices)))
+        poller.start()
+        ...
+        poller.stop()
+
+        """
+        if interval <= 0:
+            raise ValueError('Interval must be positive')
+
+        self._tickers = list(tickers)
+        self._symbols = [t.upper() for t in self._tickers]
+        self._interval = interval
+        self._fields = tuple(fields)
+        self._max_backoff = max_backoff
+
+        if fetch is None:
+            fetch = lambda tickers: yahoo.fetch_quotes(tickers, base)
+        self._fetch = fetch
+
+        n = len(self._tickers)
+        self._buffers = dict((f, RingBuffer(capacity, n)) for f in self._fields)
+        self._stamps = RingBuffer(capacity, 1)
+
+        # one row per field reused by every tick
+        self._row = np.empty(n)
+
+        self._queue = Queue.Queue(maxsize=backlog)
+        self._listeners = []
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._threads = []
+        self._failures = 0
+        self._error = None
+
+    def get_tickers(self):
+        """Returns the tickers in column order"""
+        return self._tickers
+
+    def subscribe(self, listener):
+        """Registers listener, called with the poller on the buffer thread after every tick is stored"""
+        self._listeners.append(listener)
+
+    def latest(self, field):
+        """Returns a copy of the latest value of field for every ticker, NaN where none was quoted; see
+            latest_into to read every tick without allocating"""
+        with self._lock:
+            return self._buffers[field].latest().copy()
+
+    def latest_into(self, field, out):
+        """Copies the latest value of field for every ticker into out, an N numpy.ndarray owned by the
+            caller, and returns out"""
+        with self._lock:
+            out[:] = self._buffers[field].latest()
+        return out
+
+    def last(self, field, k):
+        """Returns a k x N copy of the last k ticks of field, oldest first"""
+        with self._lock:
+            return self._buffers[field].last(k)
+
+    def get_times(self, k):
+        """Returns the times of the last k ticks as seconds since the epoch, oldest first"""
+        with self._lock:
+            return self._stamps.last(k)[:, 0]
+
+    def __len__(self):
+        with self._lock:
+            return len(self._stamps)
+
+    def get_error(self):
+        """Returns the last fetch error and the number of consecutive failures"""
+        return self._error, self._failures
+
+    def start(self):
+        """Starts the poll and buffer threads"""
+        if self._threads:
+            raise ValueError('Poller is already running')
+
+        self._stop.clear()
+        self._threads = [threading.Thread(target=self._poll), threading.Thread(target=self._drain)]
+        for thread in self._threads:
+            thread.daemon = True
+            thread.start()
+
+    def stop(self, timeout=None):
+        """Stops polling and waits for the threads to finish"""
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def _backoff(self):
+        """Seconds to wait after the current run of failures: uniform on [0, interval * 2^failures], capped"""
+        return random.uniform(0, min(self._max_backoff, self._interval * 2 ** min(self._failures, 30)))
+
+    def _poll(self):
+        while not self._stop.is_set():
+            s = time.time()
+
+            try:
+                quotes = self._fetch(self._tickers)
+            except Exception, e:
+                self._failures += 1
+                self._error = e
+                self._stop.wait(self._backoff())
+                continue
+
+            self._failures = 0
+
+            # blocks while the buffers are behind, which pauses polling
+            while not self._stop.is_set():
+                try:
+                    self._queue.put((s, quotes), timeout=self._interval)
+                    break
+                except Queue.Full:
+                    pass
+
+            self._stop.wait(max(0.0, self._interval - (time.time() - s)))
+
+    def _drain(self):
+        while not self._stop.is_set() or not self._queue.empty():
+            try:
+                stamp, quotes = self._queue.get(timeout=self._interval)
+            except Queue.Empty:
+                continue
+
+            self._store(stamp, quotes)
+
+            for listener in self._listeners:
+                listener(self)
+
+    def _store(self, stamp, quotes):
+        """Appends one tick to the buffers"""
+        row = self._row
+
+        with self._lock:
+            for field in self._fields:
+                for j, symbol in enumerate(self._symbols):
+                    row[j] = _number(quotes.get(symbol, {}).get(field))
+                self._buffers[field].append(row)
+
+            self._stamps.append(stamp)
+
+def _number(value):
+    """Parses a quote value, NaN when it is missing or not a number"""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
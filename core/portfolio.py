@@ -1,36 +1,50 @@
 # standard modules
+import copy
 from math import sqrt
-from math import log
 from datetime import datetime
 import time
 
 # application specific modules
-import matplotlib.finance as fin
+# pytables is opened through store so that importing the module stays cheap
 import numpy as np
 import pandas
-import tables
 
 # custom modules
-import yahoo
 import inspricehist as ph
 import createdailytable
+import holdings
+import instrument
+import pipeline
+import resample
+import risk
+import shrinkage as sh
+import store
+import tradingcalendar
+import universe
 
 __all__ = ["_get_historic_data", "_get_historic_returns", "get_portfolio_historic_returns", 
                 "get_portfolio_historic_position_values", "get_portfolio_historic_values", "get_benchmark_weights", 
                 "get_benchmark_returns", "get_active_weights", "get_portfolio_weights", "get_expected_stock_returns", 
                 "get_active_returns", "get_expected_excess_stock_returns", "get_covariance_matrix", 
-                "get_shrunk_covariance_matrix", "get_expected_benchmark_return", "get_expected_portfolio_return", 
-                "get_portfolio_size", "get_trading_dates", "information_ratio"]
+                "get_shrunk_covariance_matrix", "get_risk_contributions", "get_expected_benchmark_return", 
+                "get_expected_portfolio_return", "get_portfolio_size", "subset", "get_trading_dates",
+                "information_ratio"]
 
 __version__ = '0.1'
 
+# largest number of periods a stored series may fall short of either end of the requested range, or skip
+# between two stored bars, and still count as covering it (weekends and market closures for daily bars)
+COVERAGE_SLACK = {'d': 7, 'w': 1, 'm': 1, 'y': 1}
+
 __author__ = 'Jason Strimpel'
 
 class Portfolio(object):
 
-    def __init__(self, portfolio, start=None, end=None, proxy=None):
-        """Initializes the portfolio by creating and populating the data table. Goes out to Yahoo and gets historic 
-            data using a Matplotlib method modified to accept a proxy and frequency of data
+    def __init__(self, portfolio, start=None, end=None, proxy=None, lazy=False, loader=None):
+        """Initializes the portfolio by creating the data table if the store has none and populating it. Goes out to Yahoo and gets historic 
+            data using a Matplotlib method modified to accept a proxy and frequency of data. In lazy mode nothing
+            is downloaded up front: the holding period of a ticker is loaded on first access, reusing what is
+            already in the data table, and then kept in memory
         
         Parameters
         ----------
@@ -40,8 +54,13 @@ class Portfolio(object):
                     an alogrithm to build thid
                 holding_periods : start and end date of holding for each position
                 shares : number of shares held in each position
+                membership : optional (entry, exit) intervals of index membership for each ticker;
+                    defaults to the holding periods, see universe.Membership
                 constraints : constraints on the portfolio
                 defaults : miscellaneous default values
+        lazy : load price history on first access instead of rebuilding the data table on construction
+        loader : object with an insert(ticker, start, end, frequency) method that fills the data table;
+            defaults to inspricehist.InsertPriceHist
         
         Usage
         -------
@@ -65,13 +84,18 @@ class Portfolio(object):
         print port.get_expected_stock_returns()
         print port.get_active_returns()
         print port.get_expected_excess_stock_returns()
-        print port.get_covariance_matrix(historic_returns)
-        print port.get_shrunk_covariance_matrix(x, shrink=None)
+        print port.get_covariance_matrix(historic_returns, dtype=np.float64, mask=None, pairwise=False)
+        print port.get_shrunk_covariance_matrix(x, shrink=None, factor=False, dtype=np.float64, path=None, key=None,
+            target=None)
+        print port.get_risk_contributions(sigma, weights)
         print port.get_expected_benchmark_return()
         print port.get_expected_portfolio_return()
         print port.get_portfolio_size()
         print port.get_trading_dates()
+        print port.get_membership().mask(start, end)
+        print port.subset(tickers).get_active_returns()
         print port.information_ratio(historic_returns)
+        port.record_trade(ticker, date, quantity)
 
         """
         # if optional start and end params are not provided, use the default values
@@ -97,21 +121,97 @@ class Portfolio(object):
         self._exp_ret = portfolio['expected_returns']
         self._hld_per = holding_periods
         self._shrs = portfolio['shares']
+        self._trades = holdings.TradeLog.from_shares(portfolio['shares'], holding_periods)
+        self._membership = universe.Membership.from_params(portfolio)
         self._freq = frequency
         self._start = start
         self._end = end
+        self._prices = None
+        self._observed = None
+        self._pipeline = None
+
+        # how dates without a price are filled in the aligned price matrix, see tradingcalendar
+        self._fill = portfolio['defaults'].get('fill', 'none')
+        self._fill_limit = portfolio['defaults'].get('fill_limit')
         
         # for those of use behind a proxy
         self._proxy = proxy
+
+        if loader is None:
+            loader = ph.InsertPriceHist(self._proxy)
+        self._loader = loader
         
-        # build the table for the data
-        createdailytable.reset_table()
-        
-        phobj = ph.InsertPriceHist(self._proxy)
+        # price history kept in memory in lazy mode, keyed by ticker
+        self._lazy = lazy
+        self._resident = {}
+
+        if lazy:
+            return
+
+        # build the table for the data unless another portfolio already has
+        createdailytable.create_table()
         
         # load the data into the data table
         for symbol in holding_periods.keys():
-            phobj.insert(symbol, holding_periods[symbol]['start'], holding_periods[symbol]['end'], frequency)
+            self._loader.insert(symbol, holding_periods[symbol]['start'], holding_periods[symbol]['end'], frequency)
+
+    def _get_resident_data(self, ticker):
+        """Returns the price history of ticker over its holding period, loading it into the data table and
+            into memory on first access
+        
+        Parameters
+        ----------
+        ticker : ticker symbol for which to get data
+        
+        Returns
+        -------
+        pandas.DataFrame : pandas.DataFrame containing the historic data for ticker over its holding period
+        
+        """
+        if ticker not in self._resident:
+            if ticker not in self._hld_per:
+                raise ValueError('Ticker %s is not held in the portfolio' % ticker)
+
+            start = self._hld_per[ticker]['start']
+            end = self._hld_per[ticker]['end']
+
+            if not self._is_stored(ticker, start, end):
+                self._loader.insert(ticker, start, end, self._freq)
+
+            self._resident[ticker] = self._read_historic_data(ticker, start, end)
+
+        return self._resident[ticker]
+
+    def _is_stored(self, ticker, start, end):
+        """Checks whether the data table already covers ticker between start and end, creating the table if
+            there is none. The stored dates must reach both ends of the range and leave no gap in between, each
+            within COVERAGE_SLACK periods, so a range that was only partially ingested is loaded again
+        
+        Returns
+        -------
+        boolean : true if the data for ticker in the table covers the range
+        
+        """
+        if not store.exists():
+            createdailytable.create_table()
+            return False
+
+        frequency = self._freq
+        start = time.mktime(start.timetuple())
+        # no bars exist past today
+        end = min(time.mktime(end.timetuple()), time.time())
+
+        condition = '(frequency == \'%s\') & (ticker == \'%s\') & (date >= start) & (date <= end)' % (frequency, ticker)
+
+        with store.reader() as h5f:
+            dates = h5f.getNode('/price_data').readWhere(condition, field='date')
+
+        if len(dates) == 0:
+            return False
+
+        keys = resample.period_keys(np.concatenate(([start], np.sort(dates), [end])), frequency)
+
+        return np.diff(keys).max() <= COVERAGE_SLACK[frequency]
 
     def _get_historic_data(self, ticker, start, end):
         """Translates the data stored in the pytables table containing the price data to a pandas.DataFrame
@@ -127,14 +227,15 @@ class Portfolio(object):
         pandas.DataFrame : pandas.DataFrame containing the historic data for ticker from start to end
         
         """
+        if self._lazy:
+            return self._get_resident_data(ticker).ix[start:end]
+
+        return self._read_historic_data(ticker, start, end)
+
+    def _read_historic_data(self, ticker, start, end):
+        """Reads the data for ticker from start to end from the pytables table, see _get_historic_data"""
         frequency = self._freq
         
-        h5f = tables.openFile('price_data.h5', 'r')
-        price_data = h5f.getNode('/price_data')
-        
-        cols = tuple([n for n in price_data.colnames])
-        colnames = cols
-
         if type(start) == str or type(start) == datetime:
             start = time.mktime(time.strptime(start.strftime("%Y-%m-%d"), "%Y-%m-%d"))
         else:
@@ -146,9 +247,17 @@ class Portfolio(object):
             raise ValueError('End date must be string (yyyy-mm-dd) or datetime object')
 
         condition = '(frequency == \'%s\') & (ticker == \'%s\') & (date >= start) & (date <= end)' % (frequency, ticker)
-        res = price_data.readWhere(condition)
-        
-        h5f.close()
+
+        with instrument.span('hdf5') as sp:
+            with store.reader() as h5f:
+                price_data = h5f.getNode('/price_data')
+                
+                cols = tuple([n for n in price_data.colnames])
+                colnames = cols
+
+                res = price_data.readWhere(condition)
+            
+            sp.size(res)
         
         cols = zip(*[row for row in res])
         data = dict(zip(colnames, cols))
@@ -175,6 +284,127 @@ class Portfolio(object):
         prices = self._get_historic_data(ticker, start, end)
         return pandas.Series(prices['adjustedClose'] / prices['adjustedClose'].shift(offset) - 1)
 
+    def _get_price_matrix(self):
+        """Builds the aligned adjusted close price matrix for the portfolio constituents on the calendar of
+            all their trading dates, filling gaps as set by the fill and fill_limit defaults ('none' if not
+            given). The matrix is built once and kept for the lifetime of the portfolio
+        
+        Returns
+        -------
+        tuple : pandas.Index of dates, list of tickers, T x N numpy.ndarray of adjusted close prices
+        
+        """
+        if self._prices is None:
+            periods = self._hld_per
+            tickers = sorted(self._shrs.keys())
+
+            series = []
+            for ticker in tickers:
+                frame = self._get_historic_data(ticker, periods[ticker]['start'], periods[ticker]['end'])
+                series.append((frame['date'].values, frame['adjustedClose'].values))
+
+            # place every ticker on the master calendar by binary search instead of joining on the index
+            with instrument.span('align') as sp:
+                calendar = tradingcalendar.TradingCalendar.union([dates for dates, closes in series])
+                prices, self._observed = calendar.align(series, self._fill, self._fill_limit)
+                dates = pandas.Index([datetime.fromtimestamp(d) for d in calendar.get_dates()])
+                self._prices = (dates, tickers, prices)
+                sp.size(prices)
+
+        return self._prices
+
+    def _get_pipeline(self, shares=None):
+        """Computes the weight and return pipeline over the aligned price matrix
+        
+        Parameters
+        ----------
+        shares : optional dictionary of share quantities overriding the portfolio holdings; results for the
+            portfolio holdings are cached
+        
+        Returns
+        -------
+        dictionary : numpy.ndarrays as returned by pipeline.compute
+        
+        """
+        dates, tickers, prices = self._get_price_matrix()
+
+        if shares is not None:
+            with instrument.span('pipeline'):
+                return pipeline.compute(prices, self._get_share_matrix(shares))
+
+        if self._pipeline is None:
+            with instrument.span('pipeline'):
+                self._pipeline = pipeline.compute(prices, self._get_share_matrix(self._trades))
+
+        return self._pipeline
+
+    def _get_share_matrix(self, shares):
+        """Lines up share quantities with the columns of the price matrix
+        
+        Parameters
+        ----------
+        shares : dictionary of constant share quantities keyed by ticker, or a holdings.TradeLog of historic
+            share quantities
+        
+        Returns
+        -------
+        numpy.ndarray : N vector of constant share quantities or T x N matrix of historic share quantities,
+            NaN for tickers without a quantity
+        
+        """
+        dates, tickers, prices = self._get_price_matrix()
+
+        if isinstance(shares, holdings.TradeLog):
+            held = shares.get_tickers()
+            if held == tickers:
+                return shares.expand(dates)
+
+            columns = dict((t, i) for i, t in enumerate(held))
+            expanded = np.column_stack((shares.expand(dates), np.nan * np.ones(len(dates))))
+            return expanded[:, [columns.get(t, len(held)) for t in tickers]]
+
+        return np.array([shares.get(t, np.nan) for t in tickers], dtype=np.float64)
+
+    def record_trade(self, ticker, date, quantity):
+        """Records a trade in the portfolio holdings; position values, weights and returns reflect it on the
+            next call
+        
+        Parameters
+        ----------
+        ticker : ticker symbol traded
+        date : datetime object on which the trade takes effect
+        quantity : signed number of shares bought (positive) or sold (negative)
+        
+        """
+        self._trades.record(ticker, date, quantity)
+        self._pipeline = None
+
+    def get_observed_mask(self):
+        """Returns which prices in the aligned price matrix were actually observed rather than filled
+        
+        Returns
+        -------
+        pandas.DataFrame : boolean pandas.DataFrame indexed by date with a column per ticker
+        
+        """
+        self._get_price_matrix()
+        return self._frame(self._observed)
+
+    def _frame(self, values):
+        """Wraps a T x N numpy.ndarray from the pipeline in a pandas.DataFrame indexed by date and ticker"""
+        dates, tickers, prices = self._get_price_matrix()
+        return pandas.DataFrame(values, index=dates, columns=tickers)
+
+    def _trimmed(self, values):
+        """Wraps values as _frame less the leading periods in which nothing is observed, which a row-wise
+            dropna would drop; the remaining rows are a view of values rather than a copy"""
+        dates, tickers, prices = self._get_price_matrix()
+
+        observed = ~np.isnan(values).all(axis=1)
+        first = np.argmax(observed) if observed.any() else len(values)
+
+        return pandas.DataFrame(values[first:], index=dates[first:], columns=tickers, copy=False)
+
     def get_portfolio_historic_returns(self):
         """Computes the historic returns of the portfolio
 
@@ -183,40 +413,29 @@ class Portfolio(object):
         pandas.DataFrame : pandas.DataFrame containing the historic returns of the portfolio
         
         """
-        shares = self._shrs
-        positions = shares.keys()
-        periods = self._hld_per 
-        
-        returns = {}
-        for position in positions:
-            returns[position] = self._get_historic_returns(position, periods[position]['start'], periods[position]['end'])
-        
-        return pandas.DataFrame(returns)
+        return self._frame(self._get_pipeline()['returns'])
 
     def get_portfolio_historic_position_values(self, shares=None):
         """Computes the historic value of the positions in the portfolio
         
         Parameters
         ----------
-        shares : this should be a matrix of historic share quantity, currently not used
+        shares : optional dictionary of constant share quantities or holdings.TradeLog of historic share
+            quantities; defaults to the portfolio holdings including recorded trades
         
         Returns
         -------
         pandas.DataFrame : pandas.DataFrame containing the values of the portfolio constituents
         
         """
-        if shares is None:
-            shares = self._shrs
-        
-        positions = shares.keys()
-        periods = self._hld_per 
+        values = self._frame(self._get_pipeline(shares)['position_values'])
+
+        if shares is not None:
+            if isinstance(shares, holdings.TradeLog):
+                return values[[t for t in values.columns if t in shares.get_tickers()]]
+            return values[sorted(shares.keys())]
 
-        prices = {}; portfolio = {}
-        for position in positions:
-            frame = self._get_historic_data(position, periods[position]['start'], periods[position]['end'])
-            prices[position] = frame['adjustedClose'] * shares[position]
- 
-        return pandas.DataFrame(prices)
+        return values
 
     def get_portfolio_historic_values(self, shares=None):
         """Computes the historic value of the entire portfolio
@@ -231,20 +450,8 @@ class Portfolio(object):
         pandas.DataFrame : pandas.DataFrame containing the historic portfolio values
         
         """
-        if shares is None:
-            shares = self._shrs
-        
-        positions = shares.keys()
-        periods = self._hld_per 
-        
-        values = {}
-        for position in positions:
-            prices = self._get_historic_data(position, periods[position]['start'], periods[position]['end'])
-            values[position] = prices['adjustedClose'] * shares[position]
- 
-        portfolio = pandas.DataFrame(values).sum(axis=1)
- 
-        return pandas.Series(portfolio)
+        dates, tickers, prices = self._get_price_matrix()
+        return pandas.Series(self._get_pipeline(shares)['portfolio_values'], index=dates)
 
     def get_benchmark_weights(self):
         """Returns the weights of the benchmark constituents
@@ -255,18 +462,7 @@ class Portfolio(object):
         pandas.DataFrame : pandas.DataFrame containing the weights of the benchmark constituents
         
         """
-        positions = self._shrs.keys()
-        
-        shares = {}
-        for ticker in positions:
-            shares[ticker] = 1
-
-        portvalue = self.get_portfolio_historic_position_values(shares)
-        total = portvalue.sum(axis=1)
-        
-        bench_weight = portvalue / total
-
-        return bench_weight
+        return self._frame(self._get_pipeline()['benchmark_weights'])
 
     def get_benchmark_returns(self):
         """Computes the returns on the constituents of the benchmark (same as portfolio only with 1 share)
@@ -276,13 +472,7 @@ class Portfolio(object):
         pandas.dataFrame : pandas.dataFrame with returns of the benchmark constituents
         
         """
-        positions = self._shrs.keys()
-        
-        shares = {}
-        for ticker in positions:
-            shares[ticker] = 1
-        
-        return self.get_portfolio_historic_position_values(shares) / self.get_portfolio_historic_position_values(shares).shift(1) - 1
+        return self._frame(self._get_pipeline()['returns'])
 
     def get_active_weights(self):
         """Computes the active portfolio weights
@@ -292,10 +482,7 @@ class Portfolio(object):
         pandas.DataFrame : pandas.DataFrame with active weights for each portfolio component
         
         """
-        portfolio = self.get_portfolio_weights()
-        bench = self.get_benchmark_weights()
-        
-        return portfolio - bench
+        return self._frame(self._get_pipeline()['active_weights'])
     
     def get_portfolio_weights(self, shares=None):
         """Computes the weights of the portfolio constituents including share holdings
@@ -306,13 +493,8 @@ class Portfolio(object):
             constituents
         
         """
-        if shares is None:
-            shares = self._shrs
-        
-        portvalue = self.get_portfolio_historic_position_values().dropna()
-        port_weight = portvalue / portvalue.sum(axis=1)
-        
-        return port_weight
+        # only the periods before any constituent is priced are dropped; a name not yet listed is NaN
+        return self._trimmed(self._get_pipeline(shares)['portfolio_weights'])
     
     def get_expected_stock_returns(self):
         """Returns the expected stock returns as defined in the input parameters
@@ -337,12 +519,8 @@ class Portfolio(object):
             constituents
         
         """
-        active_weights = self.get_active_weights()
-        returns = self.get_portfolio_historic_returns()
+        return self._frame(self._get_pipeline()['active_returns'])
 
-        return active_weights * returns
-
-    
     def get_expected_excess_stock_returns(self):
         """Computes the expected excess stock returns
             The authors build the expected excess returns by adding random noise to the realized excess returns, 
@@ -368,14 +546,7 @@ class Portfolio(object):
         elif freq == 'd':
             f = 252
         
-        expected_returns = self.get_expected_stock_returns()
-        bench_weights = self.get_benchmark_weights()
-        
-        portvalue = self.get_portfolio_historic_position_values()
-        total = portvalue.sum(axis=1)
-        port_weights = portvalue / total
-        
-        excess_returns = self.get_portfolio_historic_returns() * (port_weights - bench_weights)
+        excess_returns = self.get_active_returns()
         
         # one period lognormal model for noise
         # assumes ln(S / S_0) = m + s * randn
@@ -394,89 +565,134 @@ class Portfolio(object):
         
         # step 2.
         score = (raw - raw.mean()) / raw.std()
-        alpha = (excess_returns.std() * ic * score).dropna()
+        alpha = self._trimmed((excess_returns.std() * ic * score).values)
 
         return alpha
 
-    def get_covariance_matrix(self, historic_returns):
-        """Computes a sample covariance matrix given historic returns
+    def get_covariance_matrix(self, historic_returns, dtype=np.float64, mask=None, pairwise=False):
+        """Computes a sample covariance matrix given historic returns. Periods with a missing return are
+            dropped, unless pairwise is set
         
         Parameters
         ----------
         historic_returns : an NxM pandas.DataFrame or np.array of historic returns with
-            N assets and M periods
+            N assets and M periods, NaN where missing
+        dtype : numpy.float64, or numpy.float32 for large universes, see shrinkage.cov_cor for the error
+        mask : optional boolean numpy.ndarray of the observed returns, e.g. a slice of a mask computed once with
+            shrinkage.validity for the whole history
+        pairwise : estimate each entry on the periods both names were observed in instead, see
+            shrinkage.pairwise_covariance
         
         Returns
         -------
         pandas.DataFrame : returns an NxN pandas.DataFrame covariance matrix
         
         """
-        frame = pandas.DataFrame(historic_returns).dropna()
-        return pandas.DataFrame(np.cov(frame,  rowvar=0), index=frame.columns, columns=frame.columns)
+        if type(historic_returns) == pandas.core.frame.DataFrame:
+            values = historic_returns.values
+            columns = historic_returns.columns
+        else:
+            values = np.asarray(historic_returns)
+            columns = None
 
-    def get_shrunk_covariance_matrix(self, x, shrink=None):
+        if mask is None:
+            mask = sh.validity(values)
+
+        if pairwise:
+            cov = sh.pairwise_covariance(values, mask, dtype)
+        else:
+            complete = mask.all(axis=1)
+            cov = sh.covariance(values if complete.all() else values[complete], dtype)
+
+        return pandas.DataFrame(cov, index=columns, columns=columns)
+
+    def get_shrunk_covariance_matrix(self, x, shrink=None, factor=False, dtype=np.float64, path=None, key=None,
+            target=None):
         """Computes a covariance matrix that is "shrunk" towards a structured estimator. Code
-            borrows heavily from the MATLAB implementation available by the authors online.
+            borrows heavily from the MATLAB implementation available by the authors online. The result is
+            checked with a Cholesky factorization and repaired by eigenvalue clipping if it is not positive
+            definite, see shrinkage.factorize
         
         Parameters
         ----------
-        x : N x N sample covariance matrix of stock returns
-        shrink : given shrinkage intensity factor; if none, code calculates
+        x : T x N pandas.DataFrame or numpy.ndarray of stock returns with no missing values, e.g. the returns
+            of one estimation window
+        shrink : given shrinkage intensity factor; if none, code calculates. A given intensity reuses the
+            sample and prior matrices cached in path for key when there are any
+        factor : also return the Cholesky factor of the shrunk covariance matrix, which can be passed on to
+            optimize.optimize
+        dtype : numpy.float64, or numpy.float32 to halve the memory of the N x N matrices on large universes;
+            the shrinkage intensity is still accumulated in float64, see shrinkage.cov_cor for the error bounds
+        path : optional shrinkage.ShrinkagePath recording the intermediate quantities of the estimator
+        key : key of the window in path, e.g. the index of its last date
+        target : optional shrinkage.TargetCache of a structured target to shrink towards instead of the
+            constant correlation matrix, selected by the columns of x when they are labelled
         
         Returns
         -------
         tuple : pandas.DataFrame which contains the shrunk covariance matrix
                 : float shrinkage intensity factor
+                : N x N numpy.ndarray lower triangular Cholesky factor, if factor is true
         
         """
         if x is None:
-            raise ValueError('No covariance matrix defined')
+            raise ValueError('No returns defined')
         
         if type(x) == pandas.core.frame.DataFrame:
-            cov = x.as_matrix()
+            returns = x.as_matrix()
+            columns = x.columns
         elif type(x) == np.ndarray:
-            cov = x
+            returns = x
+            columns = None
         else:
-            raise ValueError('Covariance matrix passed must be numpy.ndarray or pandas.DataFrame')
+            raise ValueError('Returns passed must be numpy.ndarray or pandas.DataFrame')
         
-        if shrink is not None:
-            shrinkage = shrink
+        if target is None:
+            estimate = lambda terms=False: sh.cov_cor(returns, dtype, shrink, terms)
+        else:
+            tickers = None if columns is None else list(columns)
+            estimate = lambda terms=False: sh.to_target(returns, target, tickers, dtype, shrink, terms)
 
-        index = x.index
-        columns = x.columns
-        
-        [t, n] = np.shape(cov)
-        meanx = cov.mean(axis=0)
-        cov = cov - np.tile(meanx, (t, 1))
-        
-        sample = (1.0 / t) * np.dot(cov.T, cov)
-        
-        var = np.diag(sample)
-        sqrtvar = np.sqrt(var)
+        if path is None:
+            sigma, shrinkage = estimate()
+        elif shrink is not None and path.has_matrices(key):
+            sigma, shrinkage = path.shrink(key, shrink), shrink
+        else:
+            sigma, shrinkage, terms = estimate(terms=True)
+            if shrink is None:
+                path.record(key, terms)
+
+        sigma, chol, repaired = sh.factorize(sigma)
+        sigma = pandas.DataFrame(sigma, index=columns, columns=columns)
+
+        if factor:
+            return sigma, shrinkage, chol
 
-        a = np.tile(sqrtvar, (n, 1))
-        rho = (sum(sum(sample / (a * a.T))) - n) / (n*(n-1))
+        return sigma, shrinkage
+
+    def get_risk_contributions(self, sigma, weights):
+        """Decomposes the active risk of a set of active weights into the contribution of each name
+        
+        Parameters
+        ----------
+        sigma : N x N pandas.DataFrame covariance matrix, e.g. from get_shrunk_covariance_matrix
+        weights : N pandas.Series or numpy.ndarray of active weights, in the order of sigma's columns
         
-        prior = rho * (a * a.T)
-        prior[np.eye(t, n)==1] = var
+        Returns
+        -------
+        tuple : pandas.DataFrame with the marginal, component and percent contribution of each ticker, see
+            risk.decompose
+                : float ex-ante tracking error
         
-        # Frobenius-norm of matrix cov, sqrt(sum(diag(dot(cov.T, cov))))
-        # have to research this
-        c = np.linalg.norm(sample-prior, 'fro')**2
-        y = cov**2.0
-        p = np.dot((1.0 / t), sum(sum(np.dot(y.T, y))))-sum(sum(sample**2.0))
-        rdiag = np.dot((1.0 / t), sum(sum(y**2.0))) - sum(var**2.0)
-        v = np.dot((cov**3.0).T, cov) / t - ((var*sample).T)
-        v[np.eye(t, n)==1] = 0.0
-        roff = sum(sum(v * (a  / a.T)))
-        r = rdiag + np.dot(rho, roff)
+        """
+        if type(weights) == pandas.Series:
+            weights = weights[sigma.columns].values
         
-        # compute shrinkage constant
-        k = (p - r) / c
-        shrinkage = max(0.0, min(1.0, k/t))
-        sigma = np.dot(shrinkage, prior) + np.dot((1 - shrinkage), sample)
+        res = risk.decompose(sigma.values, weights)
+        contributions = pandas.DataFrame(dict((name, res[name]) for name in ['marginal', 'component', 'percent']),
+            index=sigma.columns)
         
-        return pandas.DataFrame(sigma, index=index, columns=columns), shrinkage
+        return contributions, res['tracking_error']
 
     def get_expected_benchmark_return(self):
         """Computes the expected return on the benchmark
@@ -522,6 +738,57 @@ class Portfolio(object):
         positions = holding_periods.keys()
         return len(positions)
     
+    def get_membership(self):
+        """Returns the point-in-time index membership of the tickers, see universe.Membership
+        
+        Returns
+        -------
+        Membership : interval index of the membership, in the column order of the returns
+        
+        """
+        return self._membership
+
+    def subset(self, tickers):
+        """Returns the portfolio of a subset of the constituents, e.g. a smaller index of params nested in this
+            one, sharing this portfolio's price history: the aligned price matrix is sliced in memory, so
+            nothing is read from the data table or downloaded. Its calendar is the dates on which any of
+            tickers was observed, as if it had been built on its own; weights and returns are recomputed
+            for the subset on first use
+        
+        Parameters
+        ----------
+        tickers : list of ticker symbols, all constituents of this portfolio
+        
+        Returns
+        -------
+        Portfolio : portfolio of tickers, in sorted column order
+        
+        """
+        dates, columns, prices = self._get_price_matrix()
+        tickers = sorted(tickers)
+
+        index = dict((t, j) for j, t in enumerate(columns))
+        for ticker in tickers:
+            if ticker not in index:
+                raise ValueError('Ticker %s is not held in the portfolio' % ticker)
+        cols = [index[t] for t in tickers]
+
+        observed = self._observed[:, cols]
+        rows = np.flatnonzero(observed.any(axis=1))
+
+        sub = copy.copy(self)
+        sub._hld_per = dict((t, self._hld_per[t]) for t in tickers)
+        sub._shrs = dict((t, self._shrs[t]) for t in tickers)
+        sub._exp_ret = dict((t, self._exp_ret[t]) for t in tickers if t in self._exp_ret)
+        sub._trades = self._trades.subset(tickers)
+        sub._membership = self._membership.subset(tickers)
+        sub._resident = dict((t, self._resident[t]) for t in tickers if t in self._resident)
+        sub._prices = (dates[rows], tickers, prices[np.ix_(rows, cols)])
+        sub._observed = observed[rows]
+        sub._pipeline = None
+
+        return sub
+    
     def get_trading_dates(self):
         """Returns the dates included for which there are historic returns
         
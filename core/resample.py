@@ -0,0 +1,69 @@
+# application specific modules
+import numpy as np
+
+# frequencies derived locally from daily bars
+FREQUENCIES = ('w', 'm', 'y')
+
+def period_keys(dates, freq):
+    """Maps dates to integer period keys that increase with time
+
+    Parameters
+    ----------
+    dates : numpy.ndarray of dates as seconds since the epoch, stored at local midnight (as the price table does);
+        shifting by half a day maps them to their calendar day for any UTC offset within 12 hours
+    freq : 'd', 'w' (weeks starting on Monday), 'm' or 'y'
+
+    Returns
+    -------
+    numpy.ndarray : integer key of the period containing each date
+
+    """
+    days = np.floor((np.asarray(dates, dtype=np.float64) + 43200.0) / 86400.0).astype(np.int64)
+
+    if freq == 'd':
+        return days
+    elif freq == 'w':
+        # 1970-01-01 was a thursday
+        return (days + 3) // 7
+    elif freq == 'm':
+        return days.astype('datetime64[D]').astype('datetime64[M]').astype(np.int64)
+    elif freq == 'y':
+        return days.astype('datetime64[D]').astype('datetime64[Y]').astype(np.int64)
+
+    raise ValueError('Frequency must be one of d, w, m or y')
+
+def resample(dates, bars, freq):
+    """Aggregates daily bars into bars of a lower frequency: first open, highest high, lowest low, last close,
+        total volume and last adjusted close of each period. A bar is dated on the first trading day of its
+        period, the convention of the Yahoo weekly and monthly series
+
+    Parameters
+    ----------
+    dates : T numpy.ndarray of daily dates as seconds since the epoch, sorted ascending
+    bars : T x 6 numpy.ndarray with columns open, high, low, close, volume and adjusted close
+    freq : 'w', 'm' or 'y'
+
+    Returns
+    -------
+    tuple : P numpy.ndarray of dates, P x 6 numpy.ndarray of bars
+
+    """
+    dates = np.asarray(dates, dtype=np.float64)
+    bars = np.asarray(bars, dtype=np.float64)
+
+    if len(dates) == 0:
+        return dates, bars.reshape((0, 6))
+
+    keys = period_keys(dates, freq)
+    starts = np.concatenate(([0], np.flatnonzero(np.diff(keys)) + 1))
+    ends = np.concatenate((starts[1:], [len(keys)])) - 1
+
+    out = np.empty((len(starts), 6))
+    out[:, 0] = bars[starts, 0]
+    out[:, 1] = np.maximum.reduceat(bars[:, 1], starts)
+    out[:, 2] = np.minimum.reduceat(bars[:, 2], starts)
+    out[:, 3] = bars[ends, 3]
+    out[:, 4] = np.add.reduceat(bars[:, 4], starts)
+    out[:, 5] = bars[ends, 5]
+
+    return dates[starts], out
@@ -0,0 +1,107 @@
+# application specific modules
+import numpy as np
+
+__all__ = ["CovarianceStack", "decompose"]
+
+def decompose(sigmas, weights):
+    """Decomposes the active risk of a stack of windows into the contributions of each name, with one
+        batched matrix-vector product over the whole stack
+
+    Parameters
+    ----------
+    sigmas : W x N x N numpy.ndarray of covariance matrices, or one N x N matrix
+    weights : W x N numpy.ndarray of active weights, or one N vector
+
+    Returns
+    -------
+    dictionary : tracking_error (W), and the W x N marginal (d TE / d w = sigma w / TE), component
+        (w * marginal, summing to the tracking error) and percent (component / TE, summing to one)
+        contributions; NaN in windows without active risk
+
+    """
+    sigmas = np.asarray(sigmas, dtype=np.float64)
+    weights = np.asarray(weights, dtype=np.float64)
+
+    single = sigmas.ndim == 2
+    if single:
+        sigmas = sigmas[np.newaxis]
+        weights = weights[np.newaxis]
+
+    if np.shape(weights) != np.shape(sigmas)[:2]:
+        raise ValueError('Weights must have a row for every covariance matrix and a column for every name')
+
+    g = np.einsum('wij,wj->wi', sigmas, weights)
+    variance = np.einsum('wi,wi->w', weights, g)
+
+    te = np.sqrt(np.maximum(variance, 0.0))
+    te[te == 0.0] = np.nan
+
+    marginal = g / te[:, np.newaxis]
+    component = weights * marginal
+    percent = component / te[:, np.newaxis]
+
+    res = {'tracking_error': te, 'marginal': marginal, 'component': component, 'percent': percent}
+    if single:
+        res = dict((name, values[0]) for name, values in res.items())
+
+    return res
+
+class CovarianceStack(object):
+
+    def __init__(self, assets, capacity=64):
+        """Stack of the N x N covariance matrices of the windows of a backtest, preallocated and doubled as
+            needed. A window estimated on a subset of the names is stored with zero rows and columns for the
+            others, so every window lines up with the full universe
+
+        Parameters
+        ----------
+        assets : number of names N in the universe
+        capacity : initial number of windows
+
+        """
+        self._assets = assets
+        self._stack = np.zeros((capacity, assets, assets))
+        self._keys = []
+        self._live = []
+
+    def __len__(self):
+        return len(self._keys)
+
+    def append(self, key, sigma, live=None):
+        """Adds the covariance matrix of window key
+
+        Parameters
+        ----------
+        key : key of the window, e.g. the index of its last date
+        sigma : K x K numpy.ndarray covariance matrix of the live names
+        live : N boolean numpy.ndarray of the names sigma covers; all of them by default
+
+        """
+        w = len(self._keys)
+        if w == len(self._stack):
+            grown = np.zeros((2 * w, self._assets, self._assets))
+            grown[:w] = self._stack
+            self._stack = grown
+
+        if live is None:
+            self._stack[w] = sigma
+            live = np.ones(self._assets, dtype=bool)
+        else:
+            self._stack[w] = 0.0
+            k = np.flatnonzero(live)
+            self._stack[w][np.ix_(k, k)] = sigma
+
+        self._keys.append(key)
+        self._live.append(np.array(live, dtype=bool))
+
+    def get_keys(self):
+        """Returns the window keys in the order appended"""
+        return self._keys
+
+    def get_live(self):
+        """Returns the W x N boolean matrix of the names each window covers"""
+        return np.array(self._live, dtype=bool).reshape((len(self._keys), self._assets))
+
+    def get_stack(self):
+        """Returns a W x N x N view of the stacked matrices"""
+        return self._stack[:len(self._keys)]
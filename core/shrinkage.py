@@ -0,0 +1,496 @@
+# application specific modules
+import numpy as np
+
+# floating point types the estimators can compute in
+DTYPES = (np.float32, np.float64)
+
+def _dtype(dtype):
+    """Validates a compute dtype, see DTYPES"""
+    dtype = np.dtype(dtype)
+    if dtype.type not in DTYPES:
+        raise ValueError('Dtype must be float32 or float64')
+    return dtype
+
+def covariance(x, dtype=np.float64):
+    """Computes the sample covariance matrix of x, as numpy.cov(x, rowvar=0) but in the given dtype
+
+    Parameters
+    ----------
+    x : T x N numpy.ndarray of observations with T periods and N assets
+    dtype : numpy.float64, or numpy.float32 to halve the memory traffic on large universes
+
+    Returns
+    -------
+    numpy.ndarray : N x N sample covariance matrix of type dtype
+
+    """
+    x = np.array(x, dtype=_dtype(dtype))
+    t = np.shape(x)[0]
+
+    x -= x.mean(axis=0)
+    return np.dot(x.T, x) / (t - 1)
+
+def validity(x):
+    """Returns the T x N boolean mask of the observed (not NaN) entries of x, to be computed once and reused
+        by every window cut from x"""
+    return ~np.isnan(x)
+
+def pairwise_covariance(x, mask=None, dtype=np.float64):
+    """Computes the pairwise complete covariance matrix of x: every entry is estimated on the periods in which
+        both of its assets are observed, normalized by their number less one, so a missing return only costs
+        the pairs it belongs to instead of the whole period. The sums over the common periods of each pair
+        are products of the zero filled returns and the mask, so no rows are dropped or copied per pair.
+        The matrix need not be positive semidefinite; shrinkage.factorize repairs it where it is used
+
+    Parameters
+    ----------
+    x : T x N numpy.ndarray of observations, NaN where missing
+    mask : T x N boolean numpy.ndarray of the observed entries, see validity; computed from x if not given
+    dtype : numpy.float64, or numpy.float32 to halve the memory traffic on large universes
+
+    Returns
+    -------
+    numpy.ndarray : N x N covariance matrix of type dtype, NaN for pairs observed together in fewer than
+        two periods; equal to covariance(x) when nothing is missing
+
+    """
+    if mask is None:
+        mask = validity(x)
+
+    if mask.all():
+        return covariance(x, dtype)
+
+    dtype = _dtype(dtype)
+    m = mask.astype(dtype)
+
+    # centre on the observed means for accuracy; missing entries then contribute zero to every sum
+    missing = ~mask
+    z = np.array(x, dtype=dtype)
+    z[missing] = 0.0
+    z -= z.sum(axis=0) / np.maximum(m.sum(axis=0), 1)
+    z[missing] = 0.0
+
+    n = np.dot(m.T, m)
+    s = np.dot(z.T, m)
+    cov = np.dot(z.T, z) - s * s.T / np.maximum(n, 1)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        cov /= n - 1
+    cov[n < 2] = np.nan
+
+    return cov
+
+def complete_pairs(mask, periods=2):
+    """Selects the assets whose every pair is observed together in at least periods periods, so that their
+        pairwise_covariance has no NaN. Assets are dropped one at a time, the one short in the most pairs first
+
+    Parameters
+    ----------
+    mask : T x N boolean numpy.ndarray of the observed entries, see validity
+    periods : fewest common periods allowed for a pair
+
+    Returns
+    -------
+    numpy.ndarray : N boolean vector of the assets kept
+
+    """
+    m = mask.astype(np.float64)
+    short = np.dot(m.T, m) < periods
+    keep = np.ones(len(short), dtype=bool)
+
+    while short[np.ix_(keep, keep)].any():
+        counts = np.where(keep, (short & keep).sum(axis=1), -1)
+        keep[np.argmax(counts)] = False
+
+    return keep
+
+# intermediate quantities of the estimator, see from_moments
+TERMS = ('t', 'n', 'rho', 'pi', 'rho_hat', 'gamma', 'kappa', 'shrinkage')
+
+def cov_cor(x, dtype=np.float64, shrink=None, terms=False):
+    """Shrinks the sample covariance matrix of x towards the constant correlation matrix, following covCor.m
+        by Ledoit and Wolf
+
+        In float32 the N x N matrices are formed in single precision while the sums that make up the
+        shrinkage intensity are accumulated in double precision. The intensity then differs from the
+        float64 one by the rounding of the inputs and of the products: on the 2,000 asset benchmark panel of
+        bench.precision (2,520 daily periods) the absolute difference is below 1e-8 and the entries of the
+        shrunk matrix differ by less than 1e-6 of its largest entry. Its error grows roughly with the square
+        root of the number of periods, so long windows should be checked with bench.precision before
+        relying on it
+
+    Parameters
+    ----------
+    x : T x N numpy.ndarray of observations with T periods and N assets
+    dtype : numpy.float64, or numpy.float32 to halve the memory and memory traffic of the N x N matrices
+    shrink : given shrinkage intensity; the fourth moment terms behind the estimated one are then skipped
+    terms : also return the intermediate quantities, see from_moments
+
+    Returns
+    -------
+    tuple : N x N numpy.ndarray shrunk covariance matrix of type dtype, float shrinkage intensity, and with
+        terms the dictionary of intermediate quantities
+
+    """
+    x = np.array(x, dtype=_dtype(dtype))
+    [t, n] = np.shape(x)
+    x -= x.mean(axis=0)
+
+    sample = np.dot(x.T, x) / t
+
+    if shrink is not None:
+        rho, prior = _prior(sample)
+        sigma = shrink * prior + (1 - shrink) * sample
+        if terms:
+            return sigma, shrink, {'t': t, 'n': n, 'rho': rho, 'shrinkage': shrink, 'sample': sample, 'prior': prior}
+        return sigma, shrink
+
+    y = x**2.0
+    p = float(np.dot(y.T, y).sum(dtype=np.float64) / t - (sample**2.0).sum(dtype=np.float64))
+    rdiag = float((y**2.0).sum(dtype=np.float64) / t - (np.diag(sample)**2.0).sum(dtype=np.float64))
+    v = np.dot((x**3.0).T, x) / t - np.diag(sample)[:, np.newaxis] * sample
+
+    return from_moments(t, sample, p, rdiag, v, terms)
+
+def _prior(sample):
+    """Computes the average sample correlation rho and the constant correlation prior of a sample covariance
+        matrix"""
+    n = len(sample)
+
+    var = np.diag(sample).copy()
+    sqrtvar = np.sqrt(var)
+    scale = np.outer(sqrtvar, sqrtvar)
+
+    rho = float(((sample / scale).sum(dtype=np.float64) - n) / (n*(n-1)))
+
+    prior = rho * scale
+    np.fill_diagonal(prior, var)
+
+    return rho, prior
+
+def from_moments(t, sample, p, rdiag, v, terms=False):
+    """Shrinks the sample covariance matrix towards the constant correlation matrix given the moments of the
+        Ledoit-Wolf estimator, however they were accumulated (see cov_cor and streaming.StreamingCovCor)
+
+    Parameters
+    ----------
+    t : number of periods
+    sample : N x N numpy.ndarray sample covariance matrix, normalized by t
+    p : float sum of the asymptotic variances of the entries of the sample covariance matrix (pi hat)
+    rdiag : float diagonal part of rho hat
+    v : N x N numpy.ndarray of third by first central moments less var_i * sample_ij; the diagonal is
+        overwritten
+    terms : also return the intermediate quantities
+
+    Returns
+    -------
+    tuple : N x N numpy.ndarray shrunk covariance matrix of the type of sample, float shrinkage intensity,
+        and with terms a dictionary of t, n, the average correlation rho, pi hat (pi), rho hat (rho_hat),
+        gamma hat (gamma), kappa hat (kappa), the shrinkage intensity and the sample and prior matrices
+
+    """
+    n = len(sample)
+
+    rho, prior = _prior(sample)
+    sqrtvar = np.sqrt(np.diag(prior))
+
+    # squared Frobenius norm of the difference between the sample and the prior
+    c = float(((sample - prior)**2.0).sum(dtype=np.float64))
+    np.fill_diagonal(v, 0.0)
+    roff = float((v * (sqrtvar[np.newaxis, :] / sqrtvar[:, np.newaxis])).sum(dtype=np.float64))
+    r = rdiag + rho * roff
+
+    # compute shrinkage constant
+    if c > 0.0:
+        k = (p - r) / c
+        shrinkage = max(0.0, min(1.0, k/t))
+    else:
+        # the sample already is the prior, e.g. for a single name, so there is nothing to shrink
+        k = np.nan
+        shrinkage = 0.0
+    sigma = shrinkage * prior + (1 - shrinkage) * sample
+
+    if terms:
+        return sigma, shrinkage, {'t': t, 'n': n, 'rho': rho, 'pi': p, 'rho_hat': r, 'gamma': c, 'kappa': k,
+            'shrinkage': shrinkage, 'sample': sample, 'prior': prior}
+
+    return sigma, shrinkage
+
+class TargetCache(object):
+
+    def __init__(self, target, tickers=None, sample_diagonal=False, dtype=np.float64):
+        """A structured shrinkage target, e.g. an industry block or factor model covariance matrix, with the
+            quantities of the Ledoit-Wolf intensity that do not depend on the sample computed once. For a
+            target that does not depend on the returns the covariance of its entries with the sample's
+            (rho hat) vanishes, and of gamma hat = ||S - F||^2 = ||S||^2 - 2 <S, F> + ||F||^2 only the first
+            two terms are left for each window. The target of each subset of the universe a window is
+            estimated on is cut and normed once and reused by every window on the same subset
+
+        Parameters
+        ----------
+        target : N x N numpy.ndarray or pandas.DataFrame symmetric target matrix F
+        tickers : tickers labelling the rows and columns of target; taken from a pandas.DataFrame
+        sample_diagonal : replace the diagonal of the target with the sample variances of each window, so
+            only the off diagonal structure is imposed; rho hat is then the diagonal part of the Ledoit-Wolf one
+        dtype : numpy.float64, or numpy.float32 to match a float32 sample
+
+        Usage
+        -------
+        cache = TargetCache.from_factors(loadings, factor_cov, specific, tickers)
+        sigma, shrinkage = to_target(x, cache, tickers=window_tickers)
+
+        """
+        if tickers is None and hasattr(target, 'columns'):
+            tickers = list(target.columns)
+
+        target = np.array(target, dtype=_dtype(dtype))
+        if np.ndim(target) != 2 or len(target) != np.shape(target)[1]:
+            raise ValueError('Target must be a square matrix')
+
+        if sample_diagonal:
+            np.fill_diagonal(target, 0.0)
+
+        self._target = target
+        self._tickers = None if tickers is None else list(tickers)
+        self._index = None if tickers is None else dict((t, j) for j, t in enumerate(self._tickers))
+        self._sample_diagonal = sample_diagonal
+        self._subsets = {}
+
+    @classmethod
+    def from_factors(cls, loadings, factor_cov, specific, tickers=None, dtype=np.float64):
+        """Builds the cache for the factor model covariance matrix F = B Omega B' + diag(specific)
+
+        Parameters
+        ----------
+        loadings : N x K numpy.ndarray of factor loadings B, e.g. industry dummies for a block target
+        factor_cov : K x K numpy.ndarray factor covariance matrix Omega
+        specific : N numpy.ndarray of specific variances
+
+        """
+        loadings = np.asarray(loadings, dtype=np.float64)
+        target = np.dot(np.dot(loadings, factor_cov), loadings.T)
+        target[np.diag_indices_from(target)] += specific
+        return cls(target, tickers, dtype=dtype)
+
+    def get_tickers(self):
+        """Returns the tickers labelling the target, if any"""
+        return self._tickers
+
+    def is_sample_diagonal(self):
+        """Returns whether the diagonal of the target is taken from the sample"""
+        return self._sample_diagonal
+
+    def get(self, tickers=None):
+        """Returns the target of a subset of the universe and its squared Frobenius norm, computed on first use
+
+        Parameters
+        ----------
+        tickers : tickers of the subset in the order of the sample; the whole universe if none
+
+        Returns
+        -------
+        tuple : K x K numpy.ndarray target (zero diagonal with sample_diagonal), float squared Frobenius norm
+
+        """
+        key = None if tickers is None else tuple(tickers)
+        if key not in self._subsets:
+            if key is None:
+                target = self._target
+            else:
+                if self._index is None:
+                    raise ValueError('Target has no tickers to select a subset by')
+                k = [self._index[t] for t in key]
+                target = self._target[np.ix_(k, k)]
+            self._subsets[key] = (target, float((target**2.0).sum(dtype=np.float64)))
+
+        return self._subsets[key]
+
+def to_target(x, cache, tickers=None, dtype=np.float64, shrink=None, terms=False):
+    """Shrinks the sample covariance matrix of x towards a structured target, following the general
+        intensity of Ledoit and Wolf with the target's own terms taken from a TargetCache. Each window only
+        pays for the sample matrix, pi hat, and the inner product of the sample with the target
+
+    Parameters
+    ----------
+    x : T x N numpy.ndarray of observations with T periods and N assets
+    cache : TargetCache of the target
+    tickers : tickers of the columns of x, to select their target from the cache; all of them if none
+    dtype : numpy.float64, or numpy.float32 for the N x N matrices, see cov_cor
+    shrink : given shrinkage intensity; pi hat and the other intensity terms are then skipped
+    terms : also return the intermediate quantities, see from_moments; rho, the average correlation of the
+        constant correlation target, is NaN
+
+    Returns
+    -------
+    tuple : N x N numpy.ndarray shrunk covariance matrix of type dtype, float shrinkage intensity, and with
+        terms the dictionary of intermediate quantities
+
+    """
+    x = np.array(x, dtype=_dtype(dtype))
+    [t, n] = np.shape(x)
+    x -= x.mean(axis=0)
+
+    sample = np.dot(x.T, x) / t
+    target, norm = cache.get(tickers)
+
+    if len(target) != n:
+        raise ValueError('Target and sample must cover the same assets')
+
+    prior = np.array(target, dtype=sample.dtype)
+    if cache.is_sample_diagonal():
+        np.fill_diagonal(prior, np.diag(sample))
+
+    if shrink is not None:
+        sigma = shrink * prior + (1 - shrink) * sample
+        if terms:
+            return sigma, shrink, {'t': t, 'n': n, 'rho': np.nan, 'shrinkage': shrink, 'sample': sample,
+                'prior': prior}
+        return sigma, shrink
+
+    y = x**2.0
+    ss = (sample**2.0).sum(dtype=np.float64)
+    p = float(np.dot(y.T, y).sum(dtype=np.float64) / t - ss)
+
+    # only the diagonal of a sample diagonal target moves with the sample
+    r = 0.0
+    if cache.is_sample_diagonal():
+        d = np.diag(sample)
+        r = float((y**2.0).sum(dtype=np.float64) / t - (d**2.0).sum(dtype=np.float64))
+        ss -= (d**2.0).sum(dtype=np.float64)
+
+    # ||S - F||^2 from the cached ||F||^2; the diagonal of a sample diagonal target cancels
+    c = float(ss - 2.0 * (sample * target).sum(dtype=np.float64) + norm)
+
+    if c > 0.0:
+        k = (p - r) / c
+        shrinkage = max(0.0, min(1.0, k/t))
+    else:
+        # the sample already is the target, so there is nothing to shrink
+        k = np.nan
+        shrinkage = 0.0
+    sigma = shrinkage * prior + (1 - shrinkage) * sample
+
+    if terms:
+        return sigma, shrinkage, {'t': t, 'n': n, 'rho': np.nan, 'pi': p, 'rho_hat': r, 'gamma': c, 'kappa': k,
+            'shrinkage': shrinkage, 'sample': sample, 'prior': prior}
+
+    return sigma, shrinkage
+
+class ShrinkagePath(object):
+
+    def __init__(self, matrices=True, capacity=64):
+        """Compact store of the intermediate quantities of the estimator for a sequence of windows: one row of
+            TERMS per window in a structured numpy.ndarray, and optionally each window's sample and prior
+            matrices so that it can be shrunk again at another intensity without recomputing them
+
+        Parameters
+        ----------
+        matrices : keep the sample and prior matrices of each window
+        capacity : initial number of rows, doubled as needed
+
+        Usage
+        -------
+        path = ShrinkagePath()
+        eval.eval('shrunk', path=path)
+        print path.get_path()['shrinkage']
+        eval.eval('shrunk', path=path, shrink=0.5)
+
+        """
+        self._rows = np.zeros(capacity, dtype=[(name, np.float64) for name in TERMS])
+        self._rows[:] = np.nan
+        self._keys = []
+        self._index = {}
+        self._matrices = {} if matrices else None
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __contains__(self, key):
+        return key in self._index
+
+    def record(self, key, terms):
+        """Stores the terms of the window key, as returned by cov_cor with terms, replacing earlier ones"""
+        if key in self._index:
+            row = self._index[key]
+        else:
+            row = len(self._keys)
+            if row == len(self._rows):
+                grown = np.zeros(2 * len(self._rows), dtype=self._rows.dtype)
+                grown[:] = np.nan
+                grown[:row] = self._rows
+                self._rows = grown
+            self._keys.append(key)
+            self._index[key] = row
+
+        for name in TERMS:
+            self._rows[name][row] = terms.get(name, np.nan)
+
+        if self._matrices is not None:
+            self._matrices[key] = (terms['sample'], terms['prior'])
+
+    def get_keys(self):
+        """Returns the window keys in the order recorded"""
+        return self._keys
+
+    def get_path(self):
+        """Returns a view of the recorded rows, one per window with a field per name in TERMS"""
+        return self._rows[:len(self._keys)]
+
+    def get_terms(self, key):
+        """Returns the row of the window key"""
+        return self._rows[self._index[key]]
+
+    def has_matrices(self, key):
+        """Returns whether the sample and prior matrices of the window key are cached, see shrink"""
+        return self._matrices is not None and key in self._matrices
+
+    def shrink(self, key, shrink):
+        """Shrinks the cached sample matrix of the window key towards its cached prior at intensity shrink
+
+        Returns
+        -------
+        numpy.ndarray : N x N shrunk covariance matrix
+
+        """
+        if not self.has_matrices(key):
+            raise ValueError('No sample and prior matrices are cached for window %s' % (key,))
+
+        sample, prior = self._matrices[key]
+        return shrink * prior + (1 - shrink) * sample
+
+def factorize(sigma, floor=1e-10):
+    """Computes the Cholesky factor of a covariance matrix, repairing it first when it is not positive
+        definite (e.g. a sample covariance matrix from fewer periods than assets). The repair clips the
+        eigenvalues from below at floor times the largest one, the nearest positive definite matrix in the
+        Frobenius norm with that smallest eigenvalue
+
+    Parameters
+    ----------
+    sigma : N x N numpy.ndarray symmetric covariance matrix; float32 is kept, anything else computed in float64
+    floor : smallest eigenvalue allowed after the repair, relative to the largest
+
+    Returns
+    -------
+    tuple : N x N numpy.ndarray covariance matrix (repaired if needed), N x N numpy.ndarray lower triangular
+        Cholesky factor, boolean whether the matrix was repaired
+
+    """
+    sigma = np.asarray(sigma)
+    if sigma.dtype != np.float32:
+        sigma = np.asarray(sigma, dtype=np.float64)
+
+    try:
+        return sigma, np.linalg.cholesky(sigma), False
+    except np.linalg.LinAlgError:
+        pass
+
+    # the floor has to stay clear of the rounding error of the product below, which float32 does not
+    floor = max(floor, len(sigma) * np.finfo(sigma.dtype).eps)
+
+    w, V = np.linalg.eigh(0.5 * (sigma + sigma.T))
+    w = np.maximum(w, floor * max(w.max(), np.finfo(sigma.dtype).tiny))
+
+    repaired = np.dot(V * w, V.T)
+    repaired = 0.5 * (repaired + repaired.T)
+
+    return repaired, np.linalg.cholesky(repaired), True
@@ -0,0 +1,114 @@
+# application specific modules
+import numpy as np
+
+# custom modules
+import optimize as op
+
+def project(weights, lower=0.0, upper=1.0, iterations=60):
+    """Projects each row of weights onto the fully invested box {x : lower <= x <= upper, 1'x = 1}. The
+        projection is clip(w - tau, lower, upper) with the shift tau found by bisection, vectorized over rows
+
+    Parameters
+    ----------
+    weights : N numpy.ndarray or K x N numpy.ndarray of target weights
+    lower : lower bound on each position
+    upper : upper bound on each position
+    iterations : number of bisection steps
+
+    Returns
+    -------
+    numpy.ndarray : projected weights with the shape of weights
+
+    """
+    w = np.atleast_2d(np.asarray(weights, dtype=np.float64))
+    n = w.shape[1]
+
+    if n * lower > 1.0 or n * upper < 1.0:
+        raise ValueError('Position bounds make a fully invested portfolio infeasible')
+
+    # the row sum of the clipped weights is decreasing in tau, bracket the root
+    lo = (w.min(axis=1) - upper)[:, np.newaxis]
+    hi = (w.max(axis=1) - lower)[:, np.newaxis]
+
+    for k in xrange(iterations):
+        tau = 0.5 * (lo + hi)
+        over = np.clip(w - tau, lower, upper).sum(axis=1)[:, np.newaxis] > 1.0
+        lo = np.where(over, tau, lo)
+        hi = np.where(over, hi, tau)
+
+    x = np.clip(w - 0.5 * (lo + hi), lower, upper)
+
+    return x.reshape(np.shape(weights))
+
+def walk_forward(returns, targets, linear_cost=0.0, quadratic_cost=0.0, constraints=None, initial=None):
+    """Simulates a portfolio that drifts with returns and rebalances to target weights, charging transaction
+        costs on each trade. In period i the holdings first earn the returns of period i, then rebalance to
+        targets[i] (if any) and earn the returns of period i + 1 from there. Weight not invested is held as
+        cash earning nothing
+
+    Parameters
+    ----------
+    returns : T x N numpy.ndarray of one-period asset returns; NaN is treated as a zero return
+    targets : T x N numpy.ndarray of target weights, e.g. optimize.optimize output; rows of NaN mean no
+        rebalance in that period
+    linear_cost : cost per unit of turnover, as a fraction of portfolio value (e.g. 0.001 for 10bp)
+    quadratic_cost : cost per unit of squared trade size, as a fraction of portfolio value
+    constraints : dictionary with min_position and max_position as in params.get_portfolio_params; targets
+        are projected onto these bounds before trading
+    initial : N numpy.ndarray of weights held before the first period; defaults to all cash
+
+    Returns
+    -------
+    dictionary : T x N numpy.ndarray weights held after trading, T numpy.ndarrays gross_returns,
+        net_returns, turnover, costs and value (starting from 1.0)
+
+    """
+    r = np.asarray(returns, dtype=np.float64)
+    targets = np.asarray(targets, dtype=np.float64)
+    [t, n] = np.shape(r)
+
+    if np.shape(targets) != (t, n):
+        raise ValueError('Targets must have the same shape as returns')
+
+    growth = 1.0 + np.where(np.isnan(r), 0.0, r)
+
+    # constrain every target up front so the loop only moves arrays around
+    rebalance = ~np.isnan(targets).all(axis=1)
+    goal = np.zeros((t, n))
+    if rebalance.any():
+        lower, upper = op.position_bounds(n, constraints)
+        goal[rebalance] = project(np.nan_to_num(targets[rebalance]), lower, upper)
+
+    w = np.zeros(n) if initial is None else np.array(initial, dtype=np.float64)
+    held = np.empty((t, n))
+    gross = np.empty(t)
+    turnover = np.zeros(t)
+    costs = np.zeros(t)
+    trade = np.empty(n)
+
+    for i in xrange(t):
+        # drift the holdings with the period's returns
+        cash = 1.0 - w.sum()
+        w *= growth[i]
+        total = w.sum() + cash
+        w /= total
+        gross[i] = total - 1.0
+
+        if rebalance[i]:
+            np.subtract(goal[i], w, out=trade)
+            turnover[i] = np.abs(trade).sum()
+            costs[i] = linear_cost * turnover[i] + quadratic_cost * np.dot(trade, trade)
+            w[:] = goal[i]
+
+        held[i] = w
+
+    net = (1.0 + gross) * (1.0 - costs) - 1.0
+
+    return {
+        'weights': held,
+        'gross_returns': gross,
+        'net_returns': net,
+        'turnover': turnover,
+        'costs': costs,
+        'value': np.cumprod(1.0 + net)
+    }
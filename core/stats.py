@@ -0,0 +1,93 @@
+# standard modules
+from math import ceil, sqrt
+
+# application specific modules
+import numpy as np
+
+__all__ = ["PERIODS", "block_indices", "bootstrap"]
+
+# periods per year by data frequency, the annualization of the information ratio
+PERIODS = {'y': 1, 'm': 12, 'w': 52, 'd': 252}
+
+def block_indices(t, resamples, block, seed=None):
+    """Draws the indices of a circular block bootstrap of a series of t periods, all resamples at once
+
+    Parameters
+    ----------
+    t : length of the series
+    resamples : number of resamples B
+    block : length of the blocks; 1 is the ordinary bootstrap
+    seed : seed or numpy.random.RandomState for the draws
+
+    Returns
+    -------
+    numpy.ndarray : B x t matrix of indices into the series, each row a resample of whole blocks wrapping
+        around the end of the series
+
+    """
+    if not 1 <= block <= t:
+        raise ValueError('Block length must be between 1 and the length of the series')
+
+    rs = seed if isinstance(seed, np.random.RandomState) else np.random.RandomState(seed)
+
+    blocks = int(ceil(float(t) / block))
+    starts = rs.randint(0, t, (resamples, blocks))
+
+    idx = (starts[:, :, np.newaxis] + np.arange(block)) % t
+    return idx.reshape((resamples, blocks * block))[:, :t]
+
+def bootstrap(excess_returns, active_returns=None, resamples=10000, block=None, alpha=0.05, freq='m', seed=None):
+    """Block bootstrap confidence intervals for the statistics of eval.eval: information ratio, mean and
+        standard deviation of the excess returns, and tracking error. Every resample is drawn in one index
+        matrix and reduced along its rows, and the excess and active returns are resampled jointly
+
+    Parameters
+    ----------
+    excess_returns : T numpy.ndarray of per period excess returns of the optimized portfolio
+    active_returns : T numpy.ndarray of per period returns in excess of the benchmark, for the tracking error
+    resamples : number of resamples B
+    block : block length; defaults to T^(1/3), which preserves short range serial dependence
+    alpha : the intervals cover 1 - alpha
+    freq : frequency of the returns {d, w, m, y}, to annualize the information ratio
+    seed : seed or numpy.random.RandomState for the draws
+
+    Returns
+    -------
+    dictionary : keyed by statistic, dictionaries with the point estimate, the percentile interval (lower and
+        upper) and the bootstrap standard error (stderr)
+
+    """
+    e = np.asarray(excess_returns, dtype=np.float64).ravel()
+    t = len(e)
+
+    if t < 2:
+        raise ValueError('At least two periods are needed')
+
+    if block is None:
+        block = max(1, int(round(t ** (1.0 / 3.0))))
+
+    idx = block_indices(t, resamples, block, seed)
+    f = sqrt(PERIODS[freq])
+
+    samples = e[idx]
+    mean = samples.mean(axis=1)
+    stdev = samples.std(axis=1)
+
+    draws = {
+        'information_ratio': (f * e.mean() / e.std(), f * mean / stdev),
+        'mean_excess_return': (e.mean(), mean),
+        'stdev_excess_return': (e.std(), stdev)
+    }
+
+    if active_returns is not None:
+        a = np.asarray(active_returns, dtype=np.float64).ravel()
+        if len(a) != t:
+            raise ValueError('Excess and active returns must be of the same length')
+        draws['tracking_error'] = (a.std(), a[idx].std(axis=1))
+
+    res = {}
+    for name, (estimate, values) in draws.items():
+        lower, upper = np.percentile(values, [100.0 * alpha / 2.0, 100.0 * (1.0 - alpha / 2.0)])
+        res[name] = {'estimate': estimate, 'lower': lower, 'upper': upper, 'stderr': values.std()}
+
+    return res
@@ -0,0 +1,175 @@
+# standard modules
+from contextlib import contextmanager
+import os
+import threading
+try:
+    import fcntl
+except ImportError:
+    fcntl = None # no locking where flock is not available
+
+# application specific modules
+# pytables is imported where the store is opened so that importing the module stays cheap
+
+__all__ = ["get_path", "set_path", "exists", "get_generation", "reader", "writer", "create", "close"]
+
+# the price store; COVSHRINK_STORE points every process at the same file
+_path = os.environ.get('COVSHRINK_STORE', 'price_data.h5')
+
+# long-lived read handles keyed by absolute path: (pid, generation, file handle)
+_readers = {}
+_lock = threading.RLock()
+
+def get_path():
+    """Returns the path of the price store"""
+    return _path
+
+def set_path(path):
+    """Points the process at another price store, closing the pooled read handles"""
+    global _path
+    close()
+    _path = path
+
+def exists():
+    """Returns true if the price store has been created"""
+    return os.path.exists(_path)
+
+@contextmanager
+def _locked(path, mode):
+    """Holds the flock of the sidecar lock file of path, shared for 'r' and exclusive otherwise, and yields
+        the open lock file, which holds the generation of the store"""
+    fh = open(path + '.lock', 'a+')
+    try:
+        if fcntl is not None:
+            fcntl.flock(fh.fileno(), fcntl.LOCK_SH if mode == 'r' else fcntl.LOCK_EX)
+        yield fh
+    finally:
+        # closing the file releases the lock
+        fh.close()
+
+def _read_generation(fh):
+    fh.seek(0)
+    value = fh.read().strip()
+    return int(value) if value else 0
+
+def get_generation():
+    """Returns the generation of the store, which every committed write increments"""
+    path = os.path.abspath(_path)
+    with _locked(path, 'r') as fh:
+        return _read_generation(fh)
+
+@contextmanager
+def reader():
+    """Yields a read-only handle on the store that sees the last committed write. The handle is pooled and
+        kept open across reads; it is reopened only after a write has been committed since it was opened,
+        or in a forked child. Reads hold a shared lock, so they never see a write in progress
+
+    Usage
+    -------
+    with store.reader() as h5f:
+        rows = h5f.getNode('/price_data').readWhere(condition)
+
+    """
+    import tables
+
+    path = os.path.abspath(_path)
+
+    with _lock:
+        with _locked(path, 'r') as fh:
+            generation = _read_generation(fh)
+
+            pid, opened, h5f = _readers.get(path, (None, None, None))
+            if pid != os.getpid() or opened != generation:
+                # a handle inherited over fork belongs to the parent and is left alone
+                if pid == os.getpid():
+                    h5f.close()
+                h5f = tables.openFile(path, 'r')
+                _readers[path] = (os.getpid(), generation, h5f)
+
+            yield h5f
+
+@contextmanager
+def writer(mode='a'):
+    """Yields a writable handle on the store under the exclusive lock, so there is a single writer at a
+        time and no reader while it writes. On leaving the block the file is flushed and closed and the
+        generation incremented, which makes pooled readers reopen it
+
+    Parameters
+    ----------
+    mode : 'a' to update the store, 'w' to create it anew
+
+    Usage
+    -------
+    with store.writer() as h5f:
+        h5f.getNode('/price_data').append(rows)
+
+    """
+    import tables
+
+    path = os.path.abspath(_path)
+
+    with _lock:
+        with _locked(path, 'w') as fh:
+            generation = _read_generation(fh)
+
+            # drop this process's read handle before the file changes under it
+            pid, opened, h5f = _readers.pop(path, (None, None, None))
+            if pid == os.getpid():
+                h5f.close()
+
+            h5f = tables.openFile(path, mode)
+            try:
+                yield h5f
+                h5f.flush()
+            finally:
+                h5f.close()
+
+                fh.seek(0)
+                fh.truncate()
+                fh.write('%d\n' % (generation + 1))
+                fh.flush()
+
+def create(where, name, description, indexes=()):
+    """Creates the table name under where unless the store already holds it. The check and the creation
+        both happen under the exclusive lock, so processes starting together on a fresh store create the
+        table once and never truncate each other's data. The columns in indexes get a completely sorted
+        index, which is also added to a table created before the index was asked for
+
+    Parameters
+    ----------
+    where : path of the group holding the table
+    name : name of the table
+    description : pytables description of the table's columns
+    indexes : names of the columns to index
+
+    Returns
+    -------
+    boolean : true if the table was created, false if the store already held it
+
+    Usage
+    -------
+    store.create('/', 'price_data', description, indexes=('date',))
+
+    """
+    import tables
+
+    with writer() as h5f:
+        try:
+            table = h5f.getNode(where, name)
+            created = False
+        except tables.NoSuchNodeError:
+            table = h5f.createTable(where, name, description)
+            created = True
+
+        for column in indexes:
+            if not getattr(table.cols, column).is_indexed:
+                getattr(table.cols, column).createCSIndex()
+
+        return created
+
+def close():
+    """Closes the pooled read handles of this process"""
+    with _lock:
+        for path, (pid, generation, h5f) in _readers.items():
+            if pid == os.getpid():
+                h5f.close()
+        _readers.clear()
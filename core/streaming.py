@@ -0,0 +1,236 @@
+# standard modules
+from datetime import datetime
+import time
+
+# application specific modules
+import numpy as np
+
+# custom modules
+import createdailytable
+import instrument
+import shrinkage as sh
+import store
+
+class StreamingCovCor(object):
+
+    def __init__(self, assets):
+        """Single pass estimator of the sample covariance matrix and the Ledoit-Wolf constant correlation
+            shrinkage of a stream of return blocks. Only raw moments are kept, so memory is four N x N
+            matrices however many periods are seen, and the estimates can be taken for any subset of the
+            assets. The moments are taken about the first observation, which keeps the central moments
+            recovered from them accurate when returns have a large mean
+
+        Parameters
+        ----------
+        assets : number of assets N
+
+        Usage
+        -------
+        est = StreamingCovCor.from_table(tickers, start, end, frequency='d')
+        cov = est.covariance()
+        sigma, shrinkage = est.cov_cor()
+
+        """
+        n = assets
+
+        self._t = 0
+        self._shift = None
+
+        # sums over periods of z, z_i z_j, z_i^2 z_j, z_i^3 z_j and z_i^2 z_j^2 for z the shifted returns
+        self._s1 = np.zeros(n)
+        self._s2 = np.zeros((n, n))
+        self._s21 = np.zeros((n, n))
+        self._s31 = np.zeros((n, n))
+        self._s22 = np.zeros((n, n))
+
+    @classmethod
+    def from_table(cls, tickers, start, end, frequency='d', days=365, active=False):
+        """Accumulates the returns of tickers from start to end straight from the data table, see read_returns"""
+        est = cls(len(tickers))
+        for block in read_returns(tickers, start, end, frequency, days, active):
+            est.update(block)
+        return est
+
+    def get_count(self):
+        """Returns the number of periods accumulated"""
+        return self._t
+
+    def update(self, x):
+        """Adds a block of periods
+
+        Parameters
+        ----------
+        x : T x N numpy.ndarray of returns with no missing values
+
+        """
+        x = np.asarray(x, dtype=np.float64)
+        if len(x) == 0:
+            return
+
+        if self._shift is None:
+            self._shift = x[0].copy()
+
+        z = x - self._shift
+        z2 = z**2.0
+
+        self._t += len(z)
+        self._s1 += z.sum(axis=0)
+        self._s2 += np.dot(z.T, z)
+        self._s21 += np.dot(z2.T, z)
+        self._s31 += np.dot((z2 * z).T, z)
+        self._s22 += np.dot(z2.T, z2)
+
+    def _raw(self, live):
+        """Returns the raw moments of the live assets"""
+        if live is None:
+            return self._s1, self._s2, self._s21, self._s31, self._s22
+
+        k = np.flatnonzero(live)
+        block = np.ix_(k, k)
+        return self._s1[k], self._s2[block], self._s21[block], self._s31[block], self._s22[block]
+
+    def _moments(self, live=None):
+        """Recovers the central moments of the Ledoit-Wolf estimator from the raw moments
+
+        Parameters
+        ----------
+        live : optional N boolean numpy.ndarray of the assets to estimate on
+
+        Returns
+        -------
+        tuple : number of periods, K x K sample covariance matrix normalized by t, pi hat, the diagonal part of
+            rho hat, K x K third by first central moments less var_i * sample_ij
+
+        """
+        t = float(self._t)
+        if t < 2:
+            raise ValueError('At least two periods are needed')
+
+        s1, s2, s21, s31, s22 = self._raw(live)
+
+        m = s1 / t
+        a2 = s2 / t
+        a21 = s21 / t
+        sample = a2 - np.outer(m, m)
+        var = np.diag(sample)
+
+        # diagonals of the raw moments are the per asset sums of z^2, z^3 and z^4
+        a3 = np.diag(a21)
+        mu3 = a3 - 3.0 * m * np.diag(a2) + 2.0 * m**3.0
+
+        # E[(z_i - m_i)^2 (z_j - m_j)^2] expanded in the raw moments; its diagonal is the fourth moment
+        mi = m[:, np.newaxis]
+        mj = m[np.newaxis, :]
+        d2 = np.diag(a2)
+        c22 = s22 / t - 2.0 * mj * a21 - 2.0 * mi * a21.T + 4.0 * mi * mj * a2 + \
+            mj**2.0 * d2[:, np.newaxis] + mi**2.0 * d2[np.newaxis, :] - 3.0 * mi**2.0 * mj**2.0
+
+        rdiag = np.diag(c22).sum() - (var**2.0).sum()
+        p = c22.sum() - (sample**2.0).sum()
+
+        # E[(z_i - m_i)^3 (z_j - m_j)] expanded in the raw moments
+        v = s31 / t - 3.0 * mi * a21 + 3.0 * mi**2.0 * a2 - mi**3.0 * mj - mu3[:, np.newaxis] * mj
+        v -= var[:, np.newaxis] * sample
+
+        return t, sample, p, rdiag, v
+
+    def covariance(self, live=None):
+        """Returns the sample covariance matrix of the live assets (all by default), normalized by t - 1 as
+            numpy.cov"""
+        t = self._t
+        if t < 2:
+            raise ValueError('At least two periods are needed')
+
+        s1, s2 = self._raw(live)[:2]
+        m = s1 / t
+        return (s2 - t * np.outer(m, m)) / (t - 1)
+
+    def cov_cor(self, live=None):
+        """Shrinks the sample covariance matrix of the live assets (all by default) towards the constant
+            correlation matrix as shrinkage.cov_cor
+
+        Returns
+        -------
+        tuple : K x K numpy.ndarray shrunk covariance matrix, float shrinkage intensity
+
+        """
+        return sh.from_moments(*self._moments(live))
+
+def _stamp(date):
+    """Converts a datetime object to seconds since the epoch as stored in the price table"""
+    if not isinstance(date, datetime):
+        raise ValueError('Start and end dates must be datetime objects')
+    return time.mktime(date.timetuple())
+
+def read_returns(tickers, start, end, frequency='d', days=365, active=False):
+    """Reads the adjusted close of tickers from the data table a date range at a time and yields the returns
+        of the periods in which every ticker trades. Memory is bounded by the rows of one date range, and
+        the index on date makes each range read only its own rows, so the ranges together take one pass
+
+    Parameters
+    ----------
+    tickers : list of ticker symbols, the column order of the blocks
+    start : datetime object, first date read
+    end : datetime object, last date read
+    frequency : frequency of the data {d, w, m, y}
+    days : calendar days read per query
+    active : returns in excess of the benchmark holding one share of each ticker
+
+    Returns
+    -------
+    generator : T x N numpy.ndarrays of returns, in date order; each date range is read from the store
+        generation current when it is reached
+
+    """
+    tickers = np.array(tickers)
+    order = np.argsort(tickers)
+    start = _stamp(start)
+    end = _stamp(end)
+
+    # a store created before the date index gets it here
+    with store.reader() as h5f:
+        indexed = h5f.getNode('/price_data').cols.date.is_indexed
+    if not indexed:
+        createdailytable.create_table()
+
+    last = None
+    lo = start
+
+    while lo <= end:
+        hi = min(lo + days * 86400.0, end + 1.0)
+
+        condition = '(frequency == \'%s\') & (date >= lo) & (date < hi)' % frequency
+        with instrument.span('hdf5') as sp:
+            with store.reader() as h5f:
+                res = h5f.getNode('/price_data').readWhere(condition)
+            sp.size(res)
+
+        lo = hi
+
+        # place the rows of the range on a dates x tickers grid
+        pos = np.minimum(np.searchsorted(tickers[order], res['ticker']), len(tickers) - 1)
+        held = tickers[order][pos] == res['ticker']
+        cols = order[pos[held]]
+
+        dates = np.unique(res['date'][held])
+        rows = np.searchsorted(dates, res['date'][held])
+
+        prices = np.nan * np.ones((len(dates), len(tickers)))
+        prices[rows, cols] = res['adjustedClose'][held]
+
+        # only periods at which every ticker has a price, chained to the last one of the previous range
+        prices = prices[~np.isnan(prices).any(axis=1)]
+        if last is not None:
+            prices = np.vstack((last, prices))
+        if len(prices) == 0:
+            continue
+
+        last = prices[-1:]
+        returns = prices[1:] / prices[:-1] - 1.0
+
+        if active:
+            bench = prices[1:].sum(axis=1) / prices[:-1].sum(axis=1) - 1.0
+            returns -= bench[:, np.newaxis]
+
+        if len(returns) > 0:
+            yield returns
@@ -17,7 +17,7 @@ from cvxopt import matrix
 # get the portfolio parameters
 port_params = params.get_portfolio_params(index=10)
 # instantiate the porfolio object
-port = portfolio.Portfolio(port_params, proxy={"http": "http://proxy.jpmchase.net:8443"})
+port = portfolio.Portfolio(port_params, proxy={"http": "http://proxy.jpmchase.net:8443"}, lazy=True)
 
 dates = port.get_trading_dates()
 
@@ -0,0 +1,95 @@
+# standard modules
+import BaseHTTPServer
+import json
+import threading
+import time
+import urlparse
+
+# custom modules
+import poller
+import numpy as np
+
+# quotes served by the stub, keyed by symbol; each request moves the last price up by one cent
+quotes = {
+    'AAPL': {'LastTradePriceOnly': 100.0, 'Bid': 99.99, 'Ask': 100.01, 'Volume': 1000},
+    'MSFT': {'LastTradePriceOnly': 30.0, 'Bid': 29.99, 'Ask': 30.01, 'Volume': 2000}
+}
+failing = [False]
+
+class StubHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """Answers yql quote queries from quotes, or with a server error while failing is set"""
+
+    def do_GET(self):
+        if failing[0]:
+            self.send_response(500)
+            self.end_headers()
+            return
+
+        query = urlparse.parse_qs(urlparse.urlparse(self.path).query)['q'][0]
+        symbols = query[query.index('(')+1:query.index(')')].replace('"', '').split(',')
+
+        results = []
+        for symbol in symbols:
+            if symbol in quotes:
+                quotes[symbol]['LastTradePriceOnly'] += 0.01
+                quote = dict(quotes[symbol])
+                quote['symbol'] = symbol
+                results.append(dict((k, str(v)) for k, v in quote.items()))
+
+        body = json.dumps({'query': {'results': {'quote': results}}})
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+# serve on a free local port
+server = BaseHTTPServer.HTTPServer(('127.0.0.1', 0), StubHandler)
+thread = threading.Thread(target=server.serve_forever)
+thread.daemon = True
+thread.start()
+
+base = 'http://127.0.0.1:%d/v1/public/yql' % server.server_address[1]
+
+# a symbol the stub does not know stays NaN
+p = poller.Poller(['AAPL', 'msft', 'XXX'], interval=0.1, capacity=8, base=base)
+
+ticks = []
+price = np.empty(3)
+p.subscribe(lambda q: ticks.append(q.latest_into('LastTradePriceOnly', price)[0]))
+
+p.start()
+time.sleep(1.0)
+p.stop()
+
+print 'ticks:', len(ticks), 'buffered:', len(p)
+print 'latest:', p.latest('LastTradePriceOnly')
+print 'last 3 bids:'
+print p.last('Bid', 3)
+
+assert len(p) == min(len(ticks), 8)
+assert np.isnan(p.latest('Volume')[2])
+assert p.latest('Volume')[1] == 2000
+assert p.latest_into('Volume', np.empty(3))[1] == 2000
+assert (np.diff(ticks) > 0).all()
+assert (np.diff(p.last('LastTradePriceOnly', len(p))[:, 0]) > 0).all()
+assert (np.diff(p.get_times(len(p))) > 0).all()
+
+# failed fetches are counted and retried after a backoff, and polling recovers once the server does
+failing[0] = True
+p = poller.Poller(['AAPL'], interval=0.05, max_backoff=0.2, base=base)
+p.start()
+time.sleep(0.5)
+error, failures = p.get_error()
+print 'while failing:', failures, 'consecutive failures, last error:', error
+assert failures > 0 and len(p) == 0
+
+failing[0] = False
+time.sleep(1.0)
+p.stop()
+print 'after recovery:', len(p), 'ticks, failures:', p.get_error()[1]
+assert len(p) > 0 and p.get_error()[1] == 0
+
+server.shutdown()
@@ -0,0 +1,112 @@
+# application specific modules
+import numpy as np
+
+# fill policies for dates on which an asset has no observation
+FILLS = ('none', 'ffill')
+
+class TradingCalendar(object):
+
+    def __init__(self, dates):
+        """Master calendar of trading dates that per-asset series are placed on by binary search
+
+        Parameters
+        ----------
+        dates : sequence of dates as seconds since the epoch, in any order and with repeats
+
+        Usage
+        -------
+        calendar = TradingCalendar.union([dates_a, dates_b])
+        prices, observed = calendar.align([(dates_a, prices_a), (dates_b, prices_b)], fill='ffill')
+
+        """
+        self._dates = np.unique(np.asarray(dates, dtype=np.float64))
+
+    @classmethod
+    def union(cls, dates):
+        """Builds the calendar of every date on which at least one series trades
+
+        Parameters
+        ----------
+        dates : list of numpy.ndarrays of dates as seconds since the epoch
+
+        Returns
+        -------
+        TradingCalendar : the calendar
+
+        """
+        if len(dates) == 0:
+            return cls([])
+        return cls(np.concatenate([np.asarray(d, dtype=np.float64) for d in dates]))
+
+    def get_dates(self):
+        """Returns the sorted calendar dates as seconds since the epoch"""
+        return self._dates
+
+    def __len__(self):
+        return len(self._dates)
+
+    def locate(self, dates):
+        """Places dates on the calendar
+
+        Parameters
+        ----------
+        dates : numpy.ndarray of dates as seconds since the epoch
+
+        Returns
+        -------
+        numpy.ndarray : row of each date in the calendar, -1 for dates that are not on it
+
+        """
+        dates = np.asarray(dates, dtype=np.float64)
+        rows = np.searchsorted(self._dates, dates)
+
+        found = rows < len(self._dates)
+        found[found] = self._dates[rows[found]] == dates[found]
+
+        return np.where(found, rows, -1)
+
+    def align(self, series, fill='none', limit=None):
+        """Builds the dense T x N matrix of several series on the calendar
+
+        Parameters
+        ----------
+        series : list of N (dates, values) pairs of numpy.ndarrays
+        fill : 'none' leaves dates without an observation NaN, 'ffill' carries the last observation forward
+            (prices then show a zero return over the gap); dates before the first observation stay NaN
+        limit : largest number of consecutive dates filled by 'ffill', None for no limit
+
+        Returns
+        -------
+        tuple : T x N numpy.ndarray of values, T x N boolean numpy.ndarray marking actual observations
+
+        """
+        if fill not in FILLS:
+            raise ValueError('Fill must be one of %s' % ', '.join(FILLS))
+
+        t = len(self._dates)
+        n = len(series)
+
+        values = np.nan * np.ones((t, n))
+        observed = np.zeros((t, n), dtype=bool)
+
+        for j, (dates, column) in enumerate(series):
+            rows = self.locate(dates)
+            on = rows >= 0
+            values[rows[on], j] = np.asarray(column, dtype=np.float64)[on]
+            observed[rows[on], j] = True
+
+        observed &= ~np.isnan(values)
+
+        if fill == 'ffill' and t > 0:
+            # row of the last observation at or before each date
+            last = np.where(observed, np.arange(t)[:, np.newaxis], -1)
+            last = np.maximum.accumulate(last, axis=0)
+
+            filled = values[np.maximum(last, 0), np.arange(n)]
+            filled[last < 0] = np.nan
+            if limit is not None:
+                filled[np.arange(t)[:, np.newaxis] - last > limit] = np.nan
+
+            values = filled
+
+        return values, observed
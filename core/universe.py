@@ -0,0 +1,204 @@
+# standard modules
+from datetime import datetime
+import time
+
+# application specific modules
+import numpy as np
+
+def _stamp(date):
+    """Converts a datetime object to seconds since the epoch as stored in the price table"""
+    if not isinstance(date, datetime):
+        raise ValueError('Membership dates must be datetime objects')
+    return time.mktime(date.timetuple())
+
+class Membership(object):
+
+    def __init__(self, tickers, intervals):
+        """Point-in-time index membership stored as an interval index: every (entry, exit) interval during
+            which a ticker was in the index, sorted by entry date. A ticker may leave and rejoin
+
+        Parameters
+        ----------
+        tickers : list of ticker symbols, the column order of the masks
+        intervals : dictionary of lists of (entry, exit) datetime pairs keyed by ticker; exit None means
+            still a member
+
+        Usage
+        -------
+        membership = Membership.from_params(port_params)
+        live = membership.mask(start, end)
+
+        """
+        self._tickers = list(tickers)
+        columns = dict((t, i) for i, t in enumerate(self._tickers))
+
+        cols = []; entries = []; exits = []
+        for ticker, spans in intervals.items():
+            for entry, exit in spans:
+                cols.append(columns[ticker])
+                entries.append(_stamp(entry))
+                exits.append(np.inf if exit is None else _stamp(exit))
+
+        order = np.argsort(entries, kind='mergesort')
+        self._cols = np.array(cols, dtype=np.intp)[order]
+        self._entries = np.array(entries, dtype=np.float64)[order]
+        self._exits = np.array(exits, dtype=np.float64)[order]
+
+    @classmethod
+    def from_params(cls, portfolio):
+        """Builds the membership from portfolio parameters: the membership entry when given (a dictionary of
+            lists of (entry, exit) pairs keyed by ticker), otherwise each ticker's holding period
+
+        Parameters
+        ----------
+        portfolio : dictionary as returned by params.get_portfolio_params
+
+        Returns
+        -------
+        Membership : the membership of the tickers held
+
+        """
+        tickers = sorted(portfolio['holding_periods'].keys())
+        intervals = portfolio.get('membership')
+
+        if intervals is None:
+            periods = portfolio['holding_periods']
+            intervals = dict((t, [(periods[t]['start'], periods[t]['end'])]) for t in tickers)
+        else:
+            intervals = dict((t, intervals[t]) for t in tickers if t in intervals)
+
+        return cls(tickers, intervals)
+
+    def get_tickers(self):
+        """Returns the tickers in column order"""
+        return self._tickers
+
+    def subset(self, tickers):
+        """Returns the membership of tickers only, in the column order given, without rebuilding the intervals
+
+        Parameters
+        ----------
+        tickers : list of ticker symbols, all part of this membership
+
+        Returns
+        -------
+        Membership : the intervals of tickers, still sorted by entry
+
+        """
+        columns = dict((t, i) for i, t in enumerate(self._tickers))
+        remap = -np.ones(len(self._tickers), dtype=np.intp)
+        for j, ticker in enumerate(tickers):
+            if ticker not in columns:
+                raise ValueError('Ticker %s is not part of the membership' % ticker)
+            remap[columns[ticker]] = j
+
+        keep = remap[self._cols] >= 0
+
+        sub = Membership(tickers, {})
+        sub._cols = remap[self._cols][keep]
+        sub._entries = self._entries[keep]
+        sub._exits = self._exits[keep]
+
+        return sub
+
+    def masks(self, starts, ends):
+        """Computes which tickers were members over the whole of each window
+
+        Parameters
+        ----------
+        starts : sequence of W datetime objects, first date of each window
+        ends : sequence of W datetime objects, last date of each window
+
+        Returns
+        -------
+        numpy.ndarray : W x N boolean matrix, true where the ticker was in the index from start to end
+
+        """
+        starts = np.array([_stamp(d) for d in starts], dtype=np.float64)
+        ends = np.array([_stamp(d) for d in ends], dtype=np.float64)
+
+        # intervals are sorted by entry, so only those entered by the window start can cover it
+        entered = np.searchsorted(self._entries, starts, side='right')
+        covers = (np.arange(len(self._entries)) < entered[:, np.newaxis]) & \
+            (self._exits >= ends[:, np.newaxis])
+
+        live = np.zeros((len(starts), len(self._tickers)), dtype=bool)
+        windows, spans = np.nonzero(covers)
+        live[windows, self._cols[spans]] = True
+
+        return live
+
+    def mask(self, start, end):
+        """Computes which tickers were members over the whole window from start to end, see masks"""
+        return self.masks([start], [end])[0]
+
+class WindowBuffers(object):
+
+    def __init__(self, periods, assets):
+        """Preallocated work space for estimating on the active subset of a universe, sized for the largest
+            window and universe so that windows of varying size reuse the same memory
+
+        Parameters
+        ----------
+        periods : largest number of periods in a window
+        assets : number of assets in the universe
+
+        """
+        self._periods = periods
+        self._assets = assets
+        self._returns = np.empty(periods * assets)
+        self._cov = np.empty(assets * assets)
+
+    def take(self, values, live, drop=True):
+        """Copies the live columns of a window into the buffer, dropping periods in which any of them is
+            missing
+
+        Parameters
+        ----------
+        values : T x N numpy.ndarray of returns for the window
+        live : N boolean numpy.ndarray of the active assets
+        drop : drop the periods with missing returns; otherwise they are kept as NaN for a masked estimator,
+            see shrinkage.pairwise_covariance
+
+        Returns
+        -------
+        numpy.ndarray : contiguous T' x K view into the buffer, valid until the next call
+
+        """
+        cols = np.flatnonzero(live)
+        t = np.shape(values)[0]
+        k = len(cols)
+
+        if t > self._periods:
+            raise ValueError('Window is longer than the buffers allow')
+
+        window = self._returns[:t*k].reshape((t, k))
+        np.take(values, cols, axis=1, out=window)
+
+        if not drop:
+            return window
+
+        valid = ~np.isnan(window).any(axis=1)
+        if not valid.all():
+            rows = window[valid]
+            window = self._returns[:len(rows)*k].reshape((len(rows), k))
+            window[:] = rows
+
+        return window
+
+    def covariance(self, window):
+        """Computes the sample covariance matrix of a window returned by take, demeaning it in place
+
+        Returns
+        -------
+        numpy.ndarray : K x K view into the buffer, valid until the next call
+
+        """
+        [t, k] = np.shape(window)
+        cov = self._cov[:k*k].reshape((k, k))
+
+        window -= window.mean(axis=0)
+        np.dot(window.T, window, out=cov)
+        cov /= (t - 1)
+
+        return cov
@@ -1,6 +1,39 @@
 import urllib2
 import json
 
+# yql endpoint serving the quotes table
+YQL = 'http://query.yahooapis.com/v1/public/yql'
+
+def quote_url(ticker_list, base=YQL):
+    """Builds the yql url for the quotes of ticker_list; base points it at another server, e.g. a local stub"""
+    tickers = '%22%2C%22'.join(ticker_list).upper()
+    return base + '?q=select%20*%20from%20yahoo.finance.quotes%20where%20symbol%20in%20(%22'+tickers+'%22)&format=json&env=store%3A%2F%2Fdatatables.org%2Falltableswithkeys&callback='
+
+def fetch_quotes(ticker_list, base=YQL, timeout=10):
+    """Fetches the current quotes of ticker_list
+
+    Parameters
+    ----------
+    ticker_list : list of ticker symbols
+    base : url of the yql endpoint
+    timeout : seconds to wait for the server
+
+    Returns
+    -------
+    dictionary : quote dictionaries keyed by upper case symbol; raises urllib2.URLError on failure
+
+    """
+    response = urllib2.urlopen(urllib2.Request(quote_url(ticker_list, base)), timeout=timeout)
+    result = json.loads(response.read())
+    response.close()
+
+    data = result['query']['results']['quote']
+    # a single quote comes back as an object rather than a list
+    if type(data) == dict:
+        data = [data]
+
+    return dict((quote['symbol'].upper(), quote) for quote in data)
+
 class Yahoo(object):
     
     def __init__(self, ticker_list, proxy=None):
@@ -11,9 +44,7 @@ class Yahoo(object):
             opener = urllib2.build_opener(proxy_support)
             urllib2.install_opener(opener)
         
-        tickers = '%22%2C%22'.join(ticker_list).upper()
-        
-        url = 'http://query.yahooapis.com/v1/public/yql?q=select%20*%20from%20yahoo.finance.quotes%20where%20symbol%20in%20(%22'+tickers+'%22)&format=json&env=store%3A%2F%2Fdatatables.org%2Falltableswithkeys&callback='
+        url = quote_url(ticker_list)
         req = urllib2.Request(url)
 
         try:
@@ -24,13 +55,13 @@ class Yahoo(object):
             if hasattr(e, 'reason'):
                 print 'We failed to reach a server with reason:', e.reason
                 print 'The URL passed was:', url
-                print 'The tickers passed were:', tickers
+                print 'The tickers passed were:', ', '.join(ticker_list).upper()
                 print 'The response from Yahoo was:', e.read()
                 print
             elif hasattr(e, 'code'):
                 print 'The server couldn\'t fulfill the request with error code:', e.code
                 print 'The URL passed was:', url
-                print 'The tickers passed were:', tickers
+                print 'The tickers passed were:', ', '.join(ticker_list).upper()
                 print 'The response from Yahoo was:', e.read()
                 print
 